@@ -1,20 +1,74 @@
 # config.py
 import os
+import sys
 from pathlib import Path
 from dotenv import load_dotenv
 
+from utils.profiles import is_valid_profile_name
 
-BASE_DIR = Path(__file__).parent.absolute()
-APP_DATA_DIR = BASE_DIR / "app_data"
 
+BASE_DIR = Path(__file__).parent.absolute()
 DOT_ENV_FILE = BASE_DIR / '.env'
-WEBSITES_DATA_JSON = APP_DATA_DIR / 'websites_data.json'
-DOT_SESSION_TOKEN_FILE = APP_DATA_DIR / '.session_token'
 
 # Load environment variables from the .env file
 load_dotenv(str(DOT_ENV_FILE))
 
+# Files shared by all profiles
+ROOT_APP_DATA_DIR = BASE_DIR / "app_data"
+PROFILES_DIR = ROOT_APP_DATA_DIR / 'profiles'
+ACTIVE_PROFILE_FILE = ROOT_APP_DATA_DIR / '.active_profile'
+PROFILE_KEY_INDEX_FILE = ROOT_APP_DATA_DIR / 'profile_key_index.json'
+BREACH_INDEX_FILE = ROOT_APP_DATA_DIR / 'breach_index.bin'
+
+DEFAULT_PROFILE = 'default'
+
+
+def profile_app_data_dir(profile:str):
+    """The default profile lives directly in app_data, every other one in app_data/profiles/<name>."""
+    if not is_valid_profile_name(profile):
+        raise ValueError(f"Invalid profile name '{profile}'.")
+    return ROOT_APP_DATA_DIR if profile == DEFAULT_PROFILE else PROFILES_DIR / profile
+
+
+def _get_active_profile():
+    # WPA_PROFILE overrides the profile chosen with `profile <name>`
+    profile = os.environ.get("WPA_PROFILE")
+    source = "WPA_PROFILE"
+    if not profile and ACTIVE_PROFILE_FILE.exists():
+        profile = ACTIVE_PROFILE_FILE.read_text().strip()
+        source = str(ACTIVE_PROFILE_FILE)
+    if profile and not is_valid_profile_name(profile):
+        # Never let a name like '../..' move the data directory out of app_data.
+        # stderr, since stdout may be carrying the native-messaging protocol.
+        print(f"[Warning] Ignoring the invalid profile name '{profile}' from {source}; using '{DEFAULT_PROFILE}'.", file=sys.stderr)
+        profile = None
+    return profile or DEFAULT_PROFILE
+
+
+# Files of the active profile
+ACTIVE_PROFILE = _get_active_profile()
+APP_DATA_DIR = profile_app_data_dir(ACTIVE_PROFILE)
+
+WEBSITES_DATA_JSON = APP_DATA_DIR / 'websites_data.json'
+DOT_SESSION_TOKEN_FILE = APP_DATA_DIR / '.session_token'
+BACKUP_DIR = APP_DATA_DIR / 'backups'
+USAGE_STATS_FILE = APP_DATA_DIR / 'usage_stats.json'
+TAG_INDEX_FILE = APP_DATA_DIR / 'tag_index.json'
+ATTACHMENTS_DIR = APP_DATA_DIR / 'attachments'
+
 SECRET_KEY = os.environ.get("SECRET_KEY") or "this-is-very-very-strong-secret-key"
 SESSION_TOKEN_EXPIRATION_IN_SECONDS = int(os.environ.get("SESSION_TOKEN_EXPIRATION_IN_SECONDS") or 3600 * 3)
 
+# Where the session keeps the app key: 'keyring' (the Linux kernel session
+# keyring, falling back to the file when it is unavailable) or 'file'
+SESSION_BACKEND = (os.environ.get("SESSION_BACKEND") or "keyring").lower()
+
+# Number of previous passwords kept per website
+PASSWORD_HISTORY_SIZE = int(os.environ.get("PASSWORD_HISTORY_SIZE") or 5)
+
+# Backup retention policy
+BACKUP_KEEP_LAST = int(os.environ.get("BACKUP_KEEP_LAST") or 10)
+BACKUP_KEEP_DAILY = int(os.environ.get("BACKUP_KEEP_DAILY") or 7)
+BACKUP_KEEP_WEEKLY = int(os.environ.get("BACKUP_KEEP_WEEKLY") or 8)
+
 BULLET_UNICODE = '\u2022'
\ No newline at end of file
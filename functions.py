@@ -10,12 +10,17 @@ Make sure to customize the environment variable name ("YOUR_VAR_SAVED_IN_DOT_ENV
 based on your actual use case.
 """
 
+import difflib
 import json
 import os
+import time
 
 from utils.authentication import sha256
-from utils.encryption import decrypt
-from config import WEBSITES_DATA_JSON
+from utils.common import atomic_write, file_stamp
+from utils.migrations import CURRENT_SCHEMA_VERSION, migrate_vault
+from utils.secret_store import SecretStore
+from utils.tag_index import TagIndex, normalize_tag
+from config import WEBSITES_DATA_JSON, PASSWORD_HISTORY_SIZE, TAG_INDEX_FILE
 import logging
 
 # logger = logging.getLogger(__name__)
@@ -24,16 +29,72 @@ def clear_screen():
     """Clears the terminal screen."""
     os.system('cls' if os.name == 'nt' else 'clear')
 
-def get_user_data():
-    with open(WEBSITES_DATA_JSON, 'r') as file:
+def get_user_data(filepath=WEBSITES_DATA_JSON):
+    with open(filepath, 'r') as file:
         user_data = json.load(file)
+
+    # Upgrade vaults written by older versions on first open
+    schema_version = user_data.get('schema_version', 1)
+    if schema_version < CURRENT_SCHEMA_VERSION:
+        migrate_vault(filepath, from_version=schema_version)
+        with open(filepath, 'r') as file:
+            user_data = json.load(file)
+
     return user_data
 
-def save_user_data(data):
-    with open(WEBSITES_DATA_JSON, 'w') as f:
+def save_user_data(data, filepath=WEBSITES_DATA_JSON):
+    if 'schema_version' in data:
+        # Keep `schema_version` first so it can be read without parsing the whole file
+        data = {'schema_version': data['schema_version'], **data}
+    # An interrupted save never leaves a truncated vault
+    with atomic_write(filepath) as f:
         json.dump(data, f, indent=4)
 
-def add_website_to_database(url, keys, password=None, username=None):
+def _load_fresh_tag_index():
+    """Returns the saved tag index if it matches the vault on disk, otherwise None."""
+    index = TagIndex.load(TAG_INDEX_FILE)
+    if index is not None and index.vault_stamp == file_stamp(WEBSITES_DATA_JSON):
+        return index
+    return None
+
+def get_tag_index(user_data):
+    """Returns the tag index of `user_data`, rebuilding it if it is missing or stale."""
+    index = _load_fresh_tag_index()
+    if index is None:
+        index = TagIndex.build(user_data)
+        index.save(TAG_INDEX_FILE, file_stamp(WEBSITES_DATA_JSON))
+    return index
+
+def save_user_data_and_tag_index(user_data, changed=(), removed=()):
+    """
+    Save the user data and update the tag index for the given url hashes only.
+
+    Args:
+        user_data (dict): The user data to save.
+        changed (iterable): Url hashes of added or modified entries.
+        removed (iterable): Url hashes of deleted entries.
+    """
+    index = _load_fresh_tag_index()
+    save_user_data(user_data)
+    if index is None:
+        index = TagIndex.build(user_data)
+    else:
+        for url_hash in removed:
+            index.remove_entry(url_hash)
+        for url_hash in changed:
+            index.set_entry(url_hash, user_data['websites'][url_hash])
+    index.save(TAG_INDEX_FILE, file_stamp(WEBSITES_DATA_JSON))
+
+def get_secret_store(filepath=WEBSITES_DATA_JSON):
+    """Returns the store holding the encrypted passwords of the vault at `filepath`."""
+    return SecretStore.for_vault(filepath, history_size=PASSWORD_HISTORY_SIZE)
+
+def _touch_entry(website_info):
+    """Bumps the version and modified time of an entry. Used to merge vaults on `sync`."""
+    website_info['version'] = website_info.get('version', 0) + 1
+    website_info['modified'] = time.time()
+
+def add_website_to_database(url, keys, password=None, username=None, tags=None):
     """
     Add a new website entry to the config.json file.
 
@@ -42,20 +103,33 @@ def add_website_to_database(url, keys, password=None, username=None):
         url (str): The URL of the website to add.
         keys (list): A list of keys associated with the website.
         password (str, optional): The password associated with the website. Defaults to None.
+            It is saved in the secret store; a replaced password is kept in its history.
+        username (str, optional): The username for the website. Defaults to None.
+        tags (list, optional): Tags to add to the website. Defaults to None.
 
     Returns:
         None
     """
     user_data = get_user_data()
     url_hash = sha256(url)
+    tags = sorted({normalize_tag(tag) for tag in tags or []})
+
+    if password:
+        secrets = get_secret_store()
+        secrets.set_password(url_hash, password)
+        secrets.save()
 
     if url_hash in user_data['websites']:
         user_data['websites'][url_hash]['keys'].extend(keys)
         user_data['websites'][url_hash]['keys'] = list(set(user_data['websites'][url_hash]['keys']))
         if password:
-            user_data['websites'][url_hash]['password'] = password
+            user_data['websites'][url_hash]['has_password'] = True
+            user_data['websites'][url_hash]['password_modified'] = time.time()
         if username:
             user_data['websites'][url_hash]['username'] = username
+        if tags:
+            user_data['websites'][url_hash]['tags'] = sorted(set(user_data['websites'][url_hash].get('tags', [])) | set(tags))
+        _touch_entry(user_data['websites'][url_hash])
 
     else:
         _new_site = {
@@ -63,27 +137,107 @@ def add_website_to_database(url, keys, password=None, username=None):
             'keys': keys
         }
         if password:
-            _new_site['password'] = password
+            _new_site['has_password'] = True
+            _new_site['password_modified'] = time.time()
         if username:
             _new_site['username'] = username
+        if tags:
+            _new_site['tags'] = tags
+
+        # Continue the version history of a previously deleted entry
+        tombstone = user_data.get('deleted', {}).pop(url_hash, None)
+        if tombstone:
+            _new_site['version'] = tombstone['version']
+        _touch_entry(_new_site)
 
         user_data['websites'][url_hash] = _new_site
 
-    save_user_data(user_data)
+    save_user_data_and_tag_index(user_data, changed=[url_hash])
     # logger.info("Website added by user successfully.")
 
 
-def create_site_mapping():
+def add_attachment_reference(user_data, url_hash, reference):
+    """
+    Record an attachment on a website entry and save the user data.
+
+    Args:
+        user_data (dict): The user data.
+        url_hash (str): SHA256 hash of the website url.
+        reference (dict): The reference returned by `utils.attachments.add_attachment`.
+
+    Returns:
+        None
+    """
+    website_info = user_data['websites'][url_hash]
+    website_info.setdefault('attachments', []).append(reference)
+    _touch_entry(website_info)
+    save_user_data_and_tag_index(user_data, changed=[url_hash])
+
+
+def apply_bulk_changes(user_data, changes):
+    """
+    Apply the changes planned by `utils.bulk.plan_changes` and save everything once.
+
+    Args:
+        user_data (dict): The user data the changes were planned on.
+        changes (list): The planned changes.
+
+    Returns:
+        None
+    """
+    secrets = None
+    changed, removed = [], []
+    for change in changes:
+        url_hash = change['url_hash']
+        if change['after'] is None:
+            if secrets is None:
+                secrets = get_secret_store()
+            delete_website_from_database(user_data=user_data, url_hash=url_hash, secrets=secrets)
+            removed.append(url_hash)
+        else:
+            user_data['websites'][url_hash] = change['after']
+            _touch_entry(change['after'])
+            changed.append(url_hash)
+
+    if secrets is not None:
+        secrets.save()
+    save_user_data_and_tag_index(user_data, changed=changed, removed=removed)
+
+
+def delete_website_from_database(user_data, url_hash, secrets=None):
+    """
+    Remove a website entry and leave a tombstone behind so that `sync` does not
+    bring the entry back from another vault.
+
+    Args:
+        user_data (dict): The user data to modify in place.
+        url_hash (str): SHA256 hash of the website url.
+        secrets (SecretStore, optional): If given, the password and password
+            history of the website are removed from it too. The caller saves it.
+
+    Returns:
+        None
+    """
+    if secrets is not None:
+        secrets.delete(url_hash)
+    website_info = user_data['websites'].pop(url_hash)
+    tombstone = {'url': website_info['url'], 'version': website_info.get('version', 0)}
+    _touch_entry(tombstone)
+    user_data.setdefault('deleted', {})[url_hash] = tombstone
+
+
+def create_site_mapping(user_data=None):
     """
     Create a site_mapping dictionary based on the URLs in the config.json file.
 
     Args:
-        filename (str): The filename of the config.json file.
+        user_data (dict, optional): Already loaded user data. Loaded from the file if None.
 
     Returns:
         dict: A dictionary mapping site keys to SHA256 hashes of website URLs.
     """
-    user_data = get_user_data()
+    if user_data is None:
+        user_data = get_user_data()
 
     site_mapping = {}
     for url_hash, website_info in user_data.get('websites', {}).items():
@@ -93,27 +247,21 @@ def create_site_mapping():
     return site_mapping, user_data
 
 
-def create_password_username_mapping(app_key, user_data):
+def find_similar_keys(site_key, site_mapping):
     """
-    Create a password_mapping dictionary from the .env file.
+    Find saved site keys that look like `site_key`.
+
+    Args:
+        site_key (str): The key the user typed.
+        site_mapping (dict): The mapping returned by `create_site_mapping()`.
 
     Returns:
-        dict: A dictionary mapping SHA256 hashes of website URLs to their passwords.
+        list: Keys containing `site_key` followed by other close matches.
     """
-    password_mapping = {}
-    for url_hash, website_info in user_data.get('websites', {}).items():
-        encrypted_passwd = website_info.get('password', None)
-        username = website_info.get('username', None)
-        
-        password = (
-            decrypt(encrypted_data=encrypted_passwd, key=app_key) if encrypted_passwd
-            else ''
-        )
-        username = ('' if not username else username)
-
-        password_mapping[url_hash] = {
-            'password': password,
-            'username': username
-        }
-
-    return password_mapping
\ No newline at end of file
+    site_key = site_key.lower()
+    similar = [key for key in site_mapping if site_key in key.lower()]
+    similar.extend(
+        key for key in difflib.get_close_matches(site_key, site_mapping.keys(), n=10)
+        if key not in similar
+    )
+    return similar
@@ -4,6 +4,7 @@
 # Modified On: May 21, 2024
 # 
 # 
+import os
 import sys
 import pyperclip
 import webbrowser
@@ -11,14 +12,28 @@ import logging
 import argparse
 import json
 import pwinput
+import re
+import time
+from pathlib import Path
+from datetime import datetime
 
 from cryptography.fernet import Fernet
 
 from config import *
-from functions import create_site_mapping, create_password_username_mapping, add_website_to_database, get_user_data, save_user_data, clear_screen
+from functions import create_site_mapping, add_attachment_reference, apply_bulk_changes, add_website_to_database, delete_website_from_database, find_similar_keys, get_secret_store, get_tag_index, get_user_data, save_user_data, save_user_data_and_tag_index, clear_screen
 from utils.encryption import sha256, generate_derived_key_from_passwd, encrypt_user_private_key, hash_derived_key, decrypt_user_private_key, encrypt, decrypt
-from utils.authentication import get_password, validate_user, generate_session_token, save_session_token, get_existing_session_token, confirm_session_token
+from utils.authentication import get_password, validate_user, start_session, get_session_app_key
 from utils.bash_utilities import add_wpa_command_aliases_to_bashrc
+from utils.audit import run_audit, STALE_AFTER_DAYS
+from utils.breach import BreachIndex, build_breach_index, check_vault
+from utils.backup import SnapshotStore
+from utils.sync import SyncState, entry_versions, remove_dropped_attachments, supersede, sync_vaults, transfer_attachments
+from utils.usage import UsageStats
+from utils.migrations import CURRENT_SCHEMA_VERSION, migrate_vault, read_schema_version
+from utils.attachments import AttachmentError, add_attachment, extract_attachment, orphan_attachments, remove_attachment, strip_missing_attachments, verify_attachment
+from utils.profiles import ProfileKeyIndex, is_valid_profile_name
+from utils.bulk import select_websites, plan_changes, shared_keys
+from utils.native_messaging import NativeHost
 
 
 # logging.basicConfig(
@@ -89,17 +104,16 @@ def init(args):
 
     # Create app_data dir
     if not APP_DATA_DIR.exists():
-        APP_DATA_DIR.mkdir()
+        APP_DATA_DIR.mkdir(parents=True)
 
     # Create a blank websites_data.json
-    blank_data = {"websites": {}}
+    blank_data = {"schema_version": CURRENT_SCHEMA_VERSION, "websites": {}, "deleted": {}}
 
     # Generate Fernet key
     fernet_key = Fernet.generate_key()
 
-    # Save the session_token
-    session_token = generate_session_token(fernet_key)
-    save_session_token(token=session_token)
+    # Start the session
+    start_session(fernet_key)
 
     # Take user's password for the app
     raw_password = get_password(
@@ -121,8 +135,7 @@ def init(args):
     blank_data["password_hash"] = sha256(raw_password)
 
     # Save the data
-    with open(WEBSITES_DATA_JSON, 'w') as file:
-        json.dump(blank_data, file, indent=4)
+    save_user_data(blank_data)
     
     add_wpa_command_aliases_to_bashrc()
 
@@ -130,6 +143,20 @@ def init(args):
     # logger.info("Database initialized!")
 
 
+def _warn_if_breached(password:str):
+    """Warns the user if `password` is in the local breach index (if one was built)."""
+    if not BREACH_INDEX_FILE.exists():
+        return
+    try:
+        with BreachIndex(BREACH_INDEX_FILE) as index:
+            count = index.count(password)
+    except (OSError, ValueError) as e:
+        # A broken index must not stop the password from being saved
+        print(f"[Warning] Could not check the password against the breach index: {e}")
+        return
+    if count:
+        print(f"[Warning] This password appears {count} times in the breach corpus. Consider using a different one.")
+
 def _setup_passwd_and_username_args(args, user_data):
 
     # Checking if the app password is correct
@@ -147,8 +174,10 @@ def _setup_passwd_and_username_args(args, user_data):
     if args.site_password:
         site_passwd = get_password(
             info_msg="\n[-] Enter the password for the given website: ",
-            success_msg="The password has been saved successfully along with the website url to the database.\n"
+            success_msg=None
         )
+        _warn_if_breached(site_passwd)
+        print("The password has been saved successfully along with the website url to the database.\n")
         site_passwd_encrypted = encrypt(data=site_passwd, key=app_key)
     else:
         site_passwd_encrypted = None
@@ -170,18 +199,15 @@ def add(args):
         url=args.url,
         keys=args.keys,
         password=site_passwd_encrypted,
-        username=site_username
+        username=site_username,
+        tags=args.tags
     )
     # logger.info("Website added successfully!")
     print("Website added successfully!")
 
-def visit(args):
-    # Get user data
-    user_data = get_user_data()
-
+def _get_app_key_from_session(user_data):
     # Get app_key from session
-    existing_session_token = get_existing_session_token()
-    app_key = confirm_session_token(token=existing_session_token)
+    app_key = get_session_app_key()
     if not app_key:
         # Invalid session key
         # Ask user for password
@@ -191,32 +217,148 @@ def visit(args):
         if not validate_user(saved_password_hash=user_data['password_hash'], given_password=password):
             # logger.error("Wrong password! Exiting...")
             print("Wrong password! Try again. Exiting...")
+            sys.exit()
         
         # Get the decrypted app_key from database
         encrypted_app_key = user_data['encrypted_app_key']
         derived_key = generate_derived_key_from_passwd(password)
         app_key = decrypt_user_private_key(encrypted_private_key=encrypted_app_key, derived_key=derived_key)
         
-        # Generate new session token
-        new_token = generate_session_token(app_key)
+        # Start a new session
+        start_session(app_key)
 
-        # Save the new token
-        save_session_token(token=new_token)
+    return app_key
+
+def _select_by_tags(user_data, expression:str):
+    """Returns the url hashes of the websites matching a tag expression."""
+    index = get_tag_index(user_data)
+    try:
+        return index.url_hashes(index.query(expression))
+    except ValueError as e:
+        print(f"[Error] {e}")
+        sys.exit()
 
-    site_mapping, user_data = create_site_mapping()
-    password_username_mapping = create_password_username_mapping(app_key, user_data)
+def _print_other_matches(user_data, url_hashes):
+    if url_hashes:
+        others = [', '.join(user_data['websites'][url_hash]['keys']) for url_hash in url_hashes[:4]]
+        print(f"Other matches: {' | '.join(others)}")
+
+def _list_profiles():
+    """Returns `{profile: path of its websites_data.json}` for every initialized profile."""
+    names = [DEFAULT_PROFILE]
+    if PROFILES_DIR.exists():
+        names += sorted(path.name for path in PROFILES_DIR.iterdir() if path.is_dir() and is_valid_profile_name(path.name))
+
+    profiles = {}
+    for name in names:
+        vault = profile_app_data_dir(name) / WEBSITES_DATA_JSON.name
+        if vault.exists():
+            profiles[name] = vault
+    return profiles
+
+def _unlocked_profiles():
+    """Returns `{profile: app key}` for every profile with a live session."""
+    unlocked = {}
+    for name in _list_profiles():
+        app_key = get_session_app_key(profile_app_data_dir(name))
+        if app_key:
+            unlocked[name] = app_key
+    return unlocked
+
+def _find_key_in_other_profiles(site_key:str):
+    """
+    Look up `site_key` in the key index of the unlocked profiles.
+
+    Returns:
+        tuple: `(profile, url_hash, app_key)` of the first other profile
+               having the key, or None.
+    """
+    unlocked = _unlocked_profiles()
+    index = ProfileKeyIndex(PROFILE_KEY_INDEX_FILE)
+    index.refresh({name: profile_app_data_dir(name) / WEBSITES_DATA_JSON.name for name in unlocked})
+    index.save()
+
+    matches = [(name, url_hash) for name, url_hash in index.lookup(site_key) if name != ACTIVE_PROFILE]
+    if not matches:
+        return None
+    if len(matches) > 1:
+        print(f"'{site_key}' is also in the profile(s): {', '.join(name for name, _ in matches[1:])}")
+    name, url_hash = matches[0]
+    return name, url_hash, unlocked[name]
+
+def visit(args):
+    if args.site_key is None and args.tags is None:
+        print("[Error] Give a site key with '-k' or a tag expression with '-t'.")
+        sys.exit()
+
+    # Get user data
+    user_data = get_user_data()
+
+    site_mapping, user_data = create_site_mapping(user_data)
     site_key = args.site_key
+    vault = WEBSITES_DATA_JSON
+    app_key = None
+
+    if args.tags:
+        matching = _select_by_tags(user_data, args.tags)
+        allowed = set(matching)
+        site_mapping = {key: url_hash for key, url_hash in site_mapping.items() if url_hash in allowed}
+
+    usage = UsageStats(USAGE_STATS_FILE)
+
+    if site_key is None:
+        # Only a tag expression: open the most used matching site
+        candidates = usage.rank(matching)
+        if not candidates:
+            print(f"No website matches the tags '{args.tags}'.")
+            return
+        site_url_hash = candidates[0]
+        _print_other_matches(user_data, candidates[1:])
+    else:
+        site_url_hash = site_mapping.get(site_key)
+
+    if site_url_hash is None and args.tags is None:
+        # Not in this profile: try the other unlocked profiles
+        match = _find_key_in_other_profiles(site_key)
+        if match is not None:
+            profile, site_url_hash, app_key = match
+            vault = profile_app_data_dir(profile) / WEBSITES_DATA_JSON.name
+            user_data = get_user_data(vault)
+            usage = UsageStats(vault.parent / USAGE_STATS_FILE.name)
+            print(f"Opening '{site_key}' from the profile '{profile}'.")
 
-    site_url_hash = site_mapping.get(site_key)
     if site_url_hash is None:
-        # logger.error(f"Site key '{site_key}' not found in mappings.")
-        print(f"Site key '{site_key}' not found in mappings.")
-        return
+        similar_keys = find_similar_keys(site_key, site_mapping)
+        if not similar_keys:
+            # logger.error(f"Site key '{site_key}' not found in mappings.")
+            print(f"Site key '{site_key}' not found in mappings.")
+            return
+
+        # Never open another site unasked: its password would end up on the clipboard
+        candidates = usage.rank(dict.fromkeys(site_mapping[key] for key in similar_keys))[:5]
+        print(f"Site key '{site_key}' not found. Did you mean:")
+        for i, url_hash in enumerate(candidates, start=1):
+            website_info = user_data['websites'][url_hash]
+            print(f"  {i}. {', '.join(website_info['keys'])} ({website_info['url']})")
+        choice = input(f"Open one of them? [1-{len(candidates)}, Enter to cancel]: ").strip()
+        if not choice.isdigit() or not 1 <= int(choice) <= len(candidates):
+            print("Nothing was opened.")
+            return
+        site_url_hash = candidates[int(choice) - 1]
+
+    if app_key is None:
+        app_key = _get_app_key_from_session(user_data)
 
     site_url = user_data['websites'][site_url_hash]['url']
-    site_info = password_username_mapping.get(site_url_hash)
 
-    visit_site(url=site_url, passwd=site_info['password'])
+    # Only the password of the site being visited is read and decrypted
+    encrypted_passwd = get_secret_store(vault).get_password(site_url_hash)
+    passwd = decrypt(encrypted_data=encrypted_passwd, key=app_key)
+
+    visit_site(url=site_url, passwd=passwd)
+
+    usage.record(site_url_hash)
+    usage.save()
 
 def delete_site(args):
     # Getting user data
@@ -226,8 +368,18 @@ def delete_site(args):
     found = False
     for url_hash, website_info in user_data['websites'].items():
         if key_to_del in website_info['keys']:
-            del user_data['websites'][url_hash]
-            save_user_data(user_data)
+            secrets = get_secret_store()
+            attachments = website_info.get('attachments', [])
+            delete_website_from_database(user_data=user_data, url_hash=url_hash, secrets=secrets)
+            secrets.save()
+            save_user_data_and_tag_index(user_data, removed=[url_hash])
+            for reference in attachments:
+                remove_attachment(ATTACHMENTS_DIR, reference['id'])
+
+            usage = UsageStats(USAGE_STATS_FILE)
+            if url_hash in usage:
+                usage.forget(url_hash)
+                usage.save()
             print("Website data deleted successfully!")
             return
 
@@ -259,15 +411,121 @@ def update(args):
         url=url,
         keys=keys,
         password=site_passwd_encrypted,
-        username=site_username
+        username=site_username,
+        tags=args.tags
     )
     # logger.info("Website updated successfully!")
     print("Website updated successfully!")
 
 
+def _describe_change(change:dict):
+    """Returns the lines describing one planned bulk change."""
+    before, after = change['before'], change['after']
+    if after is None:
+        return ["DELETE"]
+    lines = []
+    if after['keys'] != before['keys']:
+        lines.append(f"Keys: {', '.join(before['keys'])} -> {', '.join(after['keys'])}")
+    if after.get('username') != before.get('username'):
+        lines.append(f"Username: {before.get('username') or '-'} -> {after.get('username') or '-'}")
+    if after.get('tags') != before.get('tags'):
+        lines.append(f"Tags: {', '.join(before.get('tags', [])) or '-'} -> {', '.join(after.get('tags', [])) or '-'}")
+    return lines
+
+def bulk(args):
+    if args.site_key is None and args.domain is None and args.username is None and args.tags is None:
+        print("[Error] Give at least one selector: '-k', '--domain', '-u' or '-t'. Use \"-k '*'\" to select every website.")
+        sys.exit()
+    operations = (args.add_keys, args.remove_keys, args.rename_key_prefix, args.set_username, args.add_tags, args.remove_tags)
+    if args.delete and any(op is not None for op in operations):
+        print("[Error] '--delete' cannot be combined with other operations.")
+        sys.exit()
+    if not args.delete and all(op is None for op in operations):
+        print("[Error] No operation given. See 'bulk --help'.")
+        sys.exit()
+
+    user_data = get_user_data()
+    websites = user_data['websites']
+
+    try:
+        selected = select_websites(
+            websites,
+            key_glob=args.site_key,
+            domain=args.domain,
+            username_regex=args.username,
+            url_hashes=_select_by_tags(user_data, args.tags) if args.tags else None
+        )
+        changes = plan_changes(
+            websites,
+            selected,
+            add_keys=args.add_keys or (),
+            remove_keys=args.remove_keys or (),
+            rename_key_prefix=args.rename_key_prefix,
+            set_username=args.set_username,
+            add_tags=args.add_tags or (),
+            remove_tags=args.remove_tags or (),
+            delete=args.delete
+        )
+    except (re.error, ValueError) as e:
+        print(f"[Error] {e}")
+        sys.exit()
+
+    if not changes:
+        print(f"{len(selected)} website(s) selected, nothing to change.")
+        return
+
+    print("======================================")
+    print("Bulk Changes:" + (" (dry run)" if args.dry_run else ""))
+    print("======================================")
+    sp = "     - "
+    for count, change in enumerate(changes, start=1):
+        print(f"[{count}] URL: {change['before']['url']}")
+        for line in _describe_change(change):
+            print(f"{sp}{line}")
+    print()
+    for key, websites_count in shared_keys(websites, changes).items():
+        print(f"[Warning] The key '{key}' would be shared by {websites_count} websites.")
+    print(f"{len(changes)} of {len(selected)} selected website(s) will change.")
+
+    if args.dry_run:
+        return
+    if not args.yes and input("Apply these changes? [y/N]: ").strip().lower() not in ('y', 'yes'):
+        print("Nothing was changed.")
+        return
+
+    # Bulk edits need an unlocked session but no password is decrypted
+    _get_app_key_from_session(user_data)
+
+    apply_bulk_changes(user_data, changes)
+
+    deleted = [change for change in changes if change['after'] is None]
+    for change in deleted:
+        for reference in change['before'].get('attachments', []):
+            remove_attachment(ATTACHMENTS_DIR, reference['id'])
+    if deleted:
+        usage = UsageStats(USAGE_STATS_FILE)
+        for change in deleted:
+            usage.forget(change['url_hash'])
+        usage.save()
+
+    print(f"Bulk changes applied to {len(changes)} website(s).")
+
+
+def _format_size(size:int):
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+def _format_attachment(reference:dict):
+    return f"{reference['name']} ({_format_size(reference['size'])}, id {reference['id'][:8]})"
+
+
 def show_db(args):
     # Get user data
     data = get_user_data()
+    url_hashes = _select_by_tags(data, args.tags) if args.tags else data["websites"].keys()
 
     clear_screen()
     print("======================================")
@@ -275,13 +533,18 @@ def show_db(args):
     print("======================================")
     sp = "     - "
     count = 1
-    for _, website in data["websites"].items():
+    for url_hash in url_hashes:
+        website = data["websites"][url_hash]
         print(f"[{count}] URL: {website['url']}")
         if 'username' in website:
             print(f"{sp}Username: {website['username']}")
-        if 'password' in website:
+        if website.get('has_password'):
             print(f"{sp}Password: [encrypted]")
         print(f"{sp}Keys: {', '.join(website['keys'])}")
+        if website.get('tags'):
+            print(f"{sp}Tags: {', '.join(website['tags'])}")
+        if website.get('attachments'):
+            print(f"{sp}Attachments: {', '.join(_format_attachment(a) for a in website['attachments'])}")
         print()
         count +=1
 
@@ -290,6 +553,22 @@ def search(args):
     data = get_user_data()
 
     site_key = args.site_key
+    if site_key is None and args.tags is None:
+        print("[Error] Give a site key with '-k' or a tag expression with '-t'.")
+        sys.exit()
+    usage = UsageStats(USAGE_STATS_FILE)
+
+    url_hashes = _select_by_tags(data, args.tags) if args.tags else data["websites"].keys()
+
+    # Exact key matches first, then partial matches, each ranked by usage
+    exact = []
+    partial = []
+    for url_hash in url_hashes:
+        website = data["websites"][url_hash]
+        if site_key is None or site_key in website['keys']:
+            exact.append(url_hash)
+        elif any(site_key.lower() in key.lower() for key in website['keys']) or site_key.lower() in website['url'].lower():
+            partial.append(url_hash)
 
     clear_screen()
     print("======================================")
@@ -297,16 +576,484 @@ def search(args):
     print("======================================")
     sp = "     - "
 
-    for _, website in data["websites"].items():
-        if site_key in website['keys']:
-            print(f"[-] URL: {website['url']}")
-            if 'username' in website:
-                print(f"{sp}Username: {website['username']}")
-            if 'password' in website:
-                print(f"{sp}Password: [encrypted]")
-            print(f"{sp}Keys: {', '.join(website['keys'])}")
-            print()
-            break
+    for url_hash in usage.rank(exact) + usage.rank(partial):
+        website = data["websites"][url_hash]
+        print(f"[-] URL: {website['url']}")
+        if 'username' in website:
+            print(f"{sp}Username: {website['username']}")
+        if website.get('has_password'):
+            print(f"{sp}Password: [encrypted]")
+        print(f"{sp}Keys: {', '.join(website['keys'])}")
+        if website.get('tags'):
+            print(f"{sp}Tags: {', '.join(website['tags'])}")
+        if website.get('attachments'):
+            print(f"{sp}Attachments: {', '.join(_format_attachment(a) for a in website['attachments'])}")
+        print()
+
+
+def export(args):
+    data = get_user_data()
+    url_hashes = _select_by_tags(data, args.tags) if args.tags else data["websites"].keys()
+
+    # Passwords are never exported
+    exported = []
+    for url_hash in url_hashes:
+        website = data["websites"][url_hash]
+        exported.append({
+            'url': website['url'],
+            'keys': website['keys'],
+            'username': website.get('username'),
+            'tags': website.get('tags', []),
+        })
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(exported, f, indent=4)
+        print(f"Exported {len(exported)} website(s) to '{args.output}'.")
+    else:
+        print(json.dumps(exported, indent=4))
+
+
+def tags(args):
+    data = get_user_data()
+    index = get_tag_index(data)
+
+    print("======================================")
+    print("Tags:")
+    print("======================================")
+    for tag, count in index.tags().items():
+        print(f"[-] {tag} ({count})")
+    print()
+
+
+def _get_website_by_key(user_data, site_key:str):
+    """Returns the url hash of the website with the key `site_key`, or exits."""
+    site_mapping, _ = create_site_mapping(user_data)
+    url_hash = site_mapping.get(site_key)
+    if url_hash is None:
+        print(f"No website found with the key '{site_key}'")
+        sys.exit()
+    return url_hash
+
+
+def attach(args):
+    user_data = get_user_data()
+    url_hash = _get_website_by_key(user_data, args.site_key)
+
+    source = Path(args.file).expanduser()
+    if not source.is_file():
+        print(f"[Error] File not found: '{args.file}'")
+        sys.exit()
+
+    app_key = _get_app_key_from_session(user_data)
+    reference = add_attachment(source_path=source, attachments_dir=ATTACHMENTS_DIR, app_key=app_key)
+    reference['added_on'] = time.time()
+    add_attachment_reference(user_data=user_data, url_hash=url_hash, reference=reference)
+
+    print(f"Attached {_format_attachment(reference)} to {user_data['websites'][url_hash]['url']}")
+
+
+def extract(args):
+    user_data = get_user_data()
+    url_hash = _get_website_by_key(user_data, args.site_key)
+    attachments = user_data['websites'][url_hash].get('attachments', [])
+
+    if args.name:
+        matching = [a for a in attachments if a['name'] == args.name or a['id'].startswith(args.name)]
+    else:
+        matching = attachments
+
+    if not matching:
+        print("No matching attachment found.")
+        sys.exit()
+    if len(matching) > 1:
+        print("More than one attachment matches. Choose one with '-n <NAME or ID>':")
+        for reference in matching:
+            print(f"     - {_format_attachment(reference)}")
+        sys.exit()
+
+    reference = matching[0]
+    output = Path(args.output).expanduser() if args.output else Path.cwd() / reference['name']
+    if output.is_dir():
+        output = output / reference['name']
+    if output.exists():
+        print(f"[Error] '{output}' already exists.")
+        sys.exit()
+
+    app_key = _get_app_key_from_session(user_data)
+    try:
+        extract_attachment(reference=reference, attachments_dir=ATTACHMENTS_DIR, app_key=app_key, output_path=output)
+    except AttachmentError as e:
+        print(f"[Error] {e}")
+        sys.exit()
+    print(f"Extracted '{reference['name']}' to '{output}'.")
+
+
+def verify_attachments(args):
+    user_data = get_user_data()
+    app_key = _get_app_key_from_session(user_data) if args.deep else None
+
+    checked = 0
+    failed = 0
+    for website in user_data['websites'].values():
+        for reference in website.get('attachments', []):
+            checked += 1
+            try:
+                verify_attachment(reference=reference, attachments_dir=ATTACHMENTS_DIR, app_key=app_key, deep=args.deep)
+            except AttachmentError as e:
+                failed += 1
+                print(f"[-] {website['url']}: {reference['name']}: {e}")
+
+    # Files left behind, e.g. by an interrupted delete or a restore
+    orphans = orphan_attachments(user_data['websites'], ATTACHMENTS_DIR)
+    for path in orphans:
+        print(f"[-] {path.name}: not referenced by any website.")
+
+    print(f"Checked {checked} attachment(s), {failed + len(orphans)} problem(s) found.")
+
+
+def stats(args):
+    data = get_user_data()
+    usage = UsageStats(USAGE_STATS_FILE)
+
+    hottest = [url_hash for url_hash in usage.hottest() if url_hash in data["websites"]][:args.top]
+    if not hottest:
+        print("No visits recorded yet.")
+        return
+
+    print("======================================")
+    print("Most Used Websites:")
+    print("======================================")
+    sp = "     - "
+    for count, url_hash in enumerate(hottest, start=1):
+        website = data["websites"][url_hash]
+        site_stats = usage.get(url_hash)
+        print(f"[{count}] URL: {website['url']}")
+        print(f"{sp}Keys: {', '.join(website['keys'])}")
+        print(f"{sp}Visits: {site_stats['count']} (score {usage.score(url_hash):.2f})")
+        print(f"{sp}Last used: {_format_timestamp(site_stats['last_used'])}")
+        print()
+
+
+def audit(args):
+    user_data = get_user_data()
+    app_key = _get_app_key_from_session(user_data)
+
+    started = time.perf_counter()
+    report = run_audit(
+        user_data=user_data,
+        secrets=get_secret_store(),
+        app_key=app_key,
+        workers=args.workers,
+        stale_after_days=args.stale_days
+    )
+    elapsed = time.perf_counter() - started
+
+    print("======================================")
+    print("Vault Health Audit:")
+    print("======================================")
+    print(f"Entries: {report['total']} ({report['with_password']} with a password)")
+    print(f"Audited in {elapsed:.2f}s\n")
+    sp = "     - "
+
+    print(f"[-] Reused passwords: {len(report['reused'])} group(s)")
+    for count, urls in enumerate(report['reused'], start=1):
+        print(f"{sp}Group {count}: {', '.join(urls)}")
+
+    print(f"\n[-] Weak passwords: {len(report['weak'])}")
+    for url, bits in report['weak']:
+        print(f"{sp}{url} (~{bits:.0f} bits)")
+
+    print(f"\n[-] Stale passwords (older than {args.stale_days} days): {len(report['stale'])}")
+    for url, age in report['stale']:
+        print(f"{sp}{url} ({age} days)")
+
+    if report['undated']:
+        print(f"\n[-] Passwords with unknown age: {len(report['undated'])}")
+        for url in report['undated']:
+            print(f"{sp}{url}")
+
+    if report['undecryptable']:
+        print(f"\n[-] Passwords that could not be decrypted: {len(report['undecryptable'])}")
+        for url in report['undecryptable']:
+            print(f"{sp}{url}")
+    print()
+
+
+def breach_index(args):
+    print(f"Building the breach index from '{args.corpus}'. This may take a while for a large corpus...")
+    count = build_breach_index(corpus_path=args.corpus, index_path=BREACH_INDEX_FILE)
+    print(f"Breach index with {count} hashes saved to '{BREACH_INDEX_FILE}'.")
+
+
+def breach(args):
+    if not BREACH_INDEX_FILE.exists():
+        print("[Error] No breach index found. Build one first with the command `breach-index`.")
+        sys.exit()
+
+    user_data = get_user_data()
+    app_key = _get_app_key_from_session(user_data)
+
+    try:
+        index = BreachIndex(BREACH_INDEX_FILE)
+    except ValueError as e:
+        print(f"[Error] {e} Rebuild it with the command `breach-index`.")
+        sys.exit()
+    with index:
+        breached = check_vault(user_data=user_data, secrets=get_secret_store(), app_key=app_key, index=index)
+
+    if not breached:
+        print("None of the saved passwords were found in the breach corpus.")
+        return
+
+    print("======================================")
+    print("Breached Passwords:")
+    print("======================================")
+    for url, count in breached:
+        print(f"[-] {url} (seen {count} times)")
+    print()
+
+
+def _format_timestamp(timestamp:float):
+    return datetime.fromtimestamp(timestamp).strftime('%d-%b-%Y %I:%M:%S %p')
+
+
+def backup(args):
+    user_data = get_user_data()
+    app_key = _get_app_key_from_session(user_data)
+    store = SnapshotStore(backup_dir=BACKUP_DIR, app_key=app_key)
+
+    if args.list:
+        snapshots = store.list_snapshots()
+        if not snapshots:
+            print("No snapshots found.")
+        for count, timestamp in enumerate(snapshots, start=1):
+            print(f"[{count}] {_format_timestamp(timestamp)}")
+        return
+
+    if args.prune:
+        removed_snapshots, removed_chunks = store.prune(
+            keep_last=BACKUP_KEEP_LAST,
+            keep_daily=BACKUP_KEEP_DAILY,
+            keep_weekly=BACKUP_KEEP_WEEKLY
+        )
+        print(f"Removed {removed_snapshots} snapshot(s) and {removed_chunks} unused chunk(s).")
+        return
+
+    timestamp, new_chunks = store.snapshot(user_data, secrets=get_secret_store())
+    if timestamp is None:
+        print("Nothing changed since the latest snapshot.")
+    else:
+        print(f"Snapshot taken at {_format_timestamp(timestamp)} ({new_chunks} new chunk(s) stored).")
+
+
+def restore(args):
+    user_data = get_user_data()
+    app_key = _get_app_key_from_session(user_data)
+    store = SnapshotStore(backup_dir=BACKUP_DIR, app_key=app_key)
+
+    if args.at:
+        try:
+            at = datetime.fromisoformat(args.at).timestamp()
+        except ValueError:
+            print(f"[Error] Invalid time '{args.at}'. Use the format 'YYYY-MM-DD HH:MM[:SS]'.")
+            sys.exit()
+    else:
+        at = None
+
+    timestamp = store.snapshot_at(at)
+    if timestamp is None:
+        print("No snapshot found at or before the given time.")
+        sys.exit()
+
+    # Keep the current state restorable too
+    secrets = get_secret_store()
+    store.snapshot(user_data, secrets=secrets)
+
+    # Snapshots taken before the secrets store existed still have the passwords
+    # inline; those are moved out by the migration on the next open.
+    restored_data, restored_secrets = store.restore(timestamp)
+
+    # Attachments removed since the snapshot cannot be brought back
+    for url, name in strip_missing_attachments(restored_data['websites'], ATTACHMENTS_DIR):
+        print(f"[Warning] The attachment '{name}' of {url} no longer exists and was left out.")
+
+    # Give every entry that changes a newer version, or the next `sync` would
+    # bring the current state back from the other vaults
+    supersede(restored_data, user_data)
+
+    secrets.replace_all(restored_secrets)
+    save_user_data(restored_data)
+    print(f"Restored the snapshot taken at {_format_timestamp(timestamp)}.")
+
+
+def _resolve_vault_path(path:str):
+    """Accepts a vault file, its `app_data` directory, the directory containing `app_data` or a profile name."""
+    candidates = [Path(path).expanduser()]
+    candidates += [candidates[0] / WEBSITES_DATA_JSON.name, candidates[0] / ROOT_APP_DATA_DIR.name / WEBSITES_DATA_JSON.name]
+    if is_valid_profile_name(path):
+        candidates.append(profile_app_data_dir(path) / WEBSITES_DATA_JSON.name)
+    for candidate in candidates:
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def sync(args):
+    other_vault = _resolve_vault_path(args.other_vault)
+    if other_vault is None:
+        print(f"[Error] No vault found at '{args.other_vault}'.")
+        sys.exit()
+    if other_vault.resolve() == WEBSITES_DATA_JSON.resolve():
+        print("[Error] Cannot sync a vault with itself.")
+        sys.exit()
+
+    user_data = get_user_data()
+    other_data = get_user_data(filepath=other_vault)
+    app_key = _get_app_key_from_session(user_data)
+
+    if other_data['encrypted_app_key'] == user_data['encrypted_app_key']:
+        other_app_key = app_key
+    else:
+        password = _input_password(info_msg="[-] Enter the app password of the other vault: ")
+        other_app_key = _validate_user_and_get_app_key(user_data=other_data, password=password)
+
+    local_secrets = get_secret_store()
+    other_secrets = get_secret_store(filepath=other_vault)
+
+    # The versions both vaults had at their last sync tell concurrent edits apart
+    local_state = SyncState.for_vault(WEBSITES_DATA_JSON)
+    other_state = SyncState.for_vault(other_vault)
+    if other_state.vault_id == local_state.vault_id:
+        # The other vault started as a copy of this one
+        other_state.new_vault_id()
+    base = local_state.base(other_state.vault_id)
+    if base is None:
+        base = other_state.base(local_state.vault_id)
+
+    report = sync_vaults(
+        local_data=user_data,
+        remote_data=other_data,
+        local_secrets=local_secrets,
+        remote_secrets=other_secrets,
+        local_key=app_key,
+        remote_key=other_app_key,
+        base=base
+    )
+
+    if not args.dry_run:
+        versions = entry_versions(user_data)
+        local_state.record(other_state.vault_id, versions)
+        other_state.record(local_state.vault_id, versions)
+
+    if not report:
+        if not args.dry_run:
+            local_state.save()
+            other_state.save()
+        print("Both vaults are already in sync.")
+        return
+
+    print("======================================")
+    print("Sync Report:" + (" (dry run)" if args.dry_run else ""))
+    print("======================================")
+    conflicts = 0
+    for change in report:
+        direction = "other vault -> this vault" if change['action'] == 'pulled' else "this vault -> other vault"
+        what = "deletion of " if change['deleted'] else ""
+        flag = " [conflict: concurrent edits, latest edit kept]" if change['conflict'] else ""
+        files = f" [{len(change['copy_attachments'])} attachment(s)]" if change['copy_attachments'] else ""
+        conflicts += change['conflict']
+        print(f"[-] {what}{change['url']} ({direction}){files}{flag}")
+    print(f"\n{len(report)} entries merged, {conflicts} conflict(s).\n")
+
+    if not args.dry_run:
+        other_attachments_dir = other_vault.parent / ATTACHMENTS_DIR.name
+        failed = transfer_attachments(
+            report, user_data, other_data,
+            local_dir=ATTACHMENTS_DIR,
+            remote_dir=other_attachments_dir,
+            local_key=app_key,
+            remote_key=other_app_key
+        )
+        for url, name, error in failed:
+            print(f"[Warning] The attachment '{name}' of {url} could not be copied and was dropped from both vaults: {error}")
+
+        local_secrets.save()
+        other_secrets.save()
+        save_user_data(user_data)
+        save_user_data(other_data, filepath=other_vault)
+        local_state.save()
+        other_state.save()
+        remove_dropped_attachments(report, local_dir=ATTACHMENTS_DIR, remote_dir=other_attachments_dir)
+
+
+def migrate(args):
+    schema_version = read_schema_version(WEBSITES_DATA_JSON)
+    if schema_version >= CURRENT_SCHEMA_VERSION:
+        print(f"The database is up to date (schema version {schema_version}).")
+        return
+
+    report = migrate_vault(WEBSITES_DATA_JSON, from_version=schema_version, dry_run=args.check)
+
+    print("======================================")
+    print("Database Migration:" + (" (dry run)" if args.check else ""))
+    print("======================================")
+    print(f"Schema version: {report['from_version']} -> {report['to_version']}")
+    print("Steps:")
+    for count, description in enumerate(report['steps'], start=1):
+        print(f"     {count}. {description}")
+    print(f"Entries: {report['entries']} ({report['changed']} changed, {report['dropped']} dropped)")
+    print(f"Size: {report['bytes_in'] / 1024:.1f} KiB -> {report['bytes_out'] / 1024:.1f} KiB")
+    print(f"Time: {report['elapsed']:.2f}s")
+    if report['backup']:
+        print(f"Backup of the old database: {report['backup']}")
+    print()
+
+
+def native_host(args):
+    # stdout carries the native-messaging protocol: nothing else may be printed here
+    host = NativeHost(
+        vault_path=WEBSITES_DATA_JSON,
+        load_vault=lambda: (get_user_data(), get_secret_store()),
+        get_app_key=get_session_app_key,
+        usage=UsageStats(USAGE_STATS_FILE)
+    )
+    host.serve(sys.stdin.buffer, sys.stdout.buffer)
+
+
+def profile(args):
+    if args.name is None:
+        profiles = _list_profiles()
+        unlocked = _unlocked_profiles()
+        print("======================================")
+        print("Profiles:")
+        print("======================================")
+        for name in sorted(set(profiles) | {ACTIVE_PROFILE}):
+            marker = '*' if name == ACTIVE_PROFILE else ' '
+            if name not in profiles:
+                state = "not initialized"
+            else:
+                state = "unlocked" if name in unlocked else "locked"
+            print(f"{marker} {name:<20} {state:<16} {profile_app_data_dir(name)}")
+        print()
+        return
+
+    name = args.name
+    if not is_valid_profile_name(name):
+        print("[Error] Profile names may only contain letters, digits, '-' and '_' (at most 32 characters).")
+        sys.exit()
+
+    if name == DEFAULT_PROFILE:
+        ACTIVE_PROFILE_FILE.unlink(missing_ok=True)
+    else:
+        ROOT_APP_DATA_DIR.mkdir(exist_ok=True)
+        ACTIVE_PROFILE_FILE.write_text(name)
+
+    print(f"Switched to the profile '{name}'.")
+    if not (profile_app_data_dir(name) / WEBSITES_DATA_JSON.name).exists():
+        print("This profile is new. Run `init` to set up its database and password.")
+    if os.environ.get("WPA_PROFILE"):
+        print(f"[Warning] WPA_PROFILE is set to '{os.environ['WPA_PROFILE']}' and takes precedence in this shell.")
 
 
 def help(args):
@@ -318,7 +1065,23 @@ def help(args):
     print("  visit         Visit an existing website by its key")
     print("  update        Update an existing website data")
     print("  del           Delete an existing website data")
+    print("  bulk          Change or delete many websites at once")
     print("  search        Search an existing website data")
+    print("  export        Export website data (without passwords) as JSON")
+    print("  tags          List all tags")
+    print("  attach        Attach an encrypted file to a website")
+    print("  extract       Decrypt an attachment of a website to a file")
+    print("  verify-attachments  Check the integrity of all attachments")
+    print("  audit         Check saved passwords for reuse, weakness and age")
+    print("  breach-index  Build the offline breach index from a downloaded corpus")
+    print("  breach        Check saved passwords against the offline breach index")
+    print("  backup        Take an encrypted incremental snapshot of the database")
+    print("  restore       Restore the database from a snapshot")
+    print("  sync          Two-way merge with another copy of the database")
+    print("  stats         Show the most used websites")
+    print("  migrate       Upgrade the database to the current schema version")
+    print("  native-host   Serve browser autofill requests (started by the browser)")
+    print("  profile       List the profiles or switch to another one")
     print("  help          Show this help message\n")
     print("For more information on a specific command, use 'python3 main.py [command] --help'")
 
@@ -337,6 +1100,7 @@ def main():
     if not init_required:
         # Show db command
         show_parser = subparsers.add_parser("list", help="Display all saved website data")
+        show_parser.add_argument('-t', "--tags", default=None, help="Tag expression, e.g. 'work & has:username' or 'personal and (finance or !shared)'")
         show_parser.set_defaults(func=show_db)
 
         # Add command
@@ -346,18 +1110,49 @@ def main():
         add_parser.add_argument('-k', "--keys", nargs="+", required=True, help="List of keys for the website.")
         add_parser.add_argument("-sp", "--site_password", dest="site_password", action="store_true", help="Password for the website")
         add_parser.add_argument("-su", "--site_username", dest="site_username", action="store_true", help="Password for the website")
+        add_parser.add_argument('-t', "--tags", nargs="+", default=None, help="List of tags for the website.")
         add_parser.set_defaults(func=add)
 
         # Visit command
         visit_parser = subparsers.add_parser("visit", help="Visit an existing website by its key.")
-        visit_parser.add_argument('-k', "--site_key", required=True, help="Website key")
+        visit_parser.add_argument('-k', "--site_key", default=None, help="Website key")
+        visit_parser.add_argument('-t', "--tags", default=None, help="Tag expression, e.g. 'work & has:username' or 'personal and (finance or !shared)'")
         visit_parser.set_defaults(func=visit)
 
         # Search command
         search_parser = subparsers.add_parser("search", help="Search an existing website by its key.")
-        search_parser.add_argument('-k', "--site_key", required=True, help="Website key")
+        search_parser.add_argument('-k', "--site_key", default=None, help="Website key")
+        search_parser.add_argument('-t', "--tags", default=None, help="Tag expression, e.g. 'work & has:username' or 'personal and (finance or !shared)'")
         search_parser.set_defaults(func=search)
 
+        # Export command
+        export_parser = subparsers.add_parser("export", help="Export website data (without passwords) as JSON.")
+        export_parser.add_argument('-t', "--tags", default=None, help="Tag expression, e.g. 'work & has:username' or 'personal and (finance or !shared)'")
+        export_parser.add_argument('-o', "--output", default=None, help="Output file (default: print to the terminal)")
+        export_parser.set_defaults(func=export)
+
+        # Tags command
+        tags_parser = subparsers.add_parser("tags", help="List all tags.")
+        tags_parser.set_defaults(func=tags)
+
+        # Attach command
+        attach_parser = subparsers.add_parser("attach", help="Attach an encrypted file to a website.")
+        attach_parser.add_argument('-k', "--site_key", required=True, help="Website key")
+        attach_parser.add_argument("file", help="File to attach")
+        attach_parser.set_defaults(func=attach)
+
+        # Extract command
+        extract_parser = subparsers.add_parser("extract", help="Decrypt an attachment of a website to a file.")
+        extract_parser.add_argument('-k', "--site_key", required=True, help="Website key")
+        extract_parser.add_argument('-n', "--name", default=None, help="Name or id of the attachment (needed if the website has more than one)")
+        extract_parser.add_argument('-o', "--output", default=None, help="Output file or directory (default: the attachment name in the current directory)")
+        extract_parser.set_defaults(func=extract)
+
+        # Verify attachments command
+        verify_parser = subparsers.add_parser("verify-attachments", help="Check the integrity of all attachments.")
+        verify_parser.add_argument("--deep", action="store_true", help="Also decrypt and authenticate every chunk")
+        verify_parser.set_defaults(func=verify_attachments)
+
         # Update command
         update_parser = subparsers.add_parser("update", help="Update an existing website data.")
         update_parser.add_argument("-p", "--password", dest="password", action="store_true", help="Password for this application that was set during initialization")
@@ -365,6 +1160,7 @@ def main():
         update_parser.add_argument('-k', "--keys", nargs="+", default=None, help="List of keys for the website.")
         update_parser.add_argument("-sp", "--site_password", dest="site_password", action="store_true", help="Password for the website")
         update_parser.add_argument("-su", "--site_username", dest="site_username", action="store_true", help="Password for the website")
+        update_parser.add_argument('-t', "--tags", nargs="+", default=None, help="List of tags to add to the website.")
         update_parser.set_defaults(func=update)
 
         # Delete command
@@ -372,6 +1168,75 @@ def main():
         del_parser.add_argument('-k', "--site_key", required=True, help="Website key")
         del_parser.set_defaults(func=delete_site)
 
+        # Bulk command
+        bulk_parser = subparsers.add_parser("bulk", help="Change or delete many websites at once.")
+        bulk_parser.add_argument('-k', "--site_key", default=None, help="Select websites having a key matching this pattern, e.g. 'old-*'")
+        bulk_parser.add_argument("--domain", default=None, help="Select websites on this domain or its subdomains")
+        bulk_parser.add_argument('-u', "--username", default=None, help="Select websites whose username matches this regular expression")
+        bulk_parser.add_argument('-t', "--tags", default=None, help="Select websites matching this tag expression")
+        bulk_parser.add_argument("--add-keys", dest="add_keys", nargs="+", default=None, help="Keys to add")
+        bulk_parser.add_argument("--remove-keys", dest="remove_keys", nargs="+", default=None, help="Keys (or patterns) to remove")
+        bulk_parser.add_argument("--rename-key-prefix", dest="rename_key_prefix", nargs=2, metavar=("OLD", "NEW"), default=None, help="Replace the prefix OLD of keys by NEW")
+        bulk_parser.add_argument("--set-username", dest="set_username", default=None, help="New username ('' removes it)")
+        bulk_parser.add_argument("--add-tags", dest="add_tags", nargs="+", default=None, help="Tags to add")
+        bulk_parser.add_argument("--remove-tags", dest="remove_tags", nargs="+", default=None, help="Tags to remove")
+        bulk_parser.add_argument("--delete", action="store_true", help="Delete the selected websites")
+        bulk_parser.add_argument("--dry-run", dest="dry_run", action="store_true", help="Only show what would change")
+        bulk_parser.add_argument('-y', "--yes", action="store_true", help="Apply without asking for confirmation")
+        bulk_parser.set_defaults(func=bulk)
+
+        # Audit command
+        audit_parser = subparsers.add_parser("audit", help="Check saved passwords for reuse, weakness and age.")
+        audit_parser.add_argument("--stale-days", dest="stale_days", type=int, default=STALE_AFTER_DAYS, help="Flag passwords not changed for this many days")
+        audit_parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count)")
+        audit_parser.set_defaults(func=audit)
+
+        # Breach index command
+        breach_index_parser = subparsers.add_parser("breach-index", help="Build the offline breach index from a downloaded corpus.")
+        breach_index_parser.add_argument("--corpus", required=True, help="SHA1 corpus file or directory of HIBP range files")
+        breach_index_parser.set_defaults(func=breach_index)
+
+        # Breach command
+        breach_parser = subparsers.add_parser("breach", help="Check saved passwords against the offline breach index.")
+        breach_parser.set_defaults(func=breach)
+
+        # Backup command
+        backup_parser = subparsers.add_parser("backup", help="Take an encrypted incremental snapshot of the database.")
+        backup_parser.add_argument("--list", action="store_true", help="List the saved snapshots")
+        backup_parser.add_argument("--prune", action="store_true", help="Apply the retention policy and remove unused chunks")
+        backup_parser.set_defaults(func=backup)
+
+        # Restore command
+        restore_parser = subparsers.add_parser("restore", help="Restore the database from a snapshot.")
+        restore_parser.add_argument("--at", default=None, help="Restore the latest snapshot taken at or before this time, e.g. '2024-05-21 18:30' (default: latest)")
+        restore_parser.set_defaults(func=restore)
+
+        # Sync command
+        sync_parser = subparsers.add_parser("sync", help="Two-way merge with another copy of the database.")
+        sync_parser.add_argument("other_vault", help="Path to the other vault (its websites_data.json, the directory containing it or a profile name)")
+        sync_parser.add_argument("--dry-run", dest="dry_run", action="store_true", help="Only report what would change")
+        sync_parser.set_defaults(func=sync)
+
+        # Stats command
+        stats_parser = subparsers.add_parser("stats", help="Show the most used websites.")
+        stats_parser.add_argument("-n", "--top", type=int, default=10, help="Number of websites to show")
+        stats_parser.set_defaults(func=stats)
+
+        # Migrate command
+        migrate_parser = subparsers.add_parser("migrate", help="Upgrade the database to the current schema version.")
+        migrate_parser.add_argument("--check", action="store_true", help="Dry run: report what the migration would do and cost")
+        migrate_parser.set_defaults(func=migrate)
+
+        # Native messaging host command
+        native_host_parser = subparsers.add_parser("native-host", help="Serve browser autofill requests over native messaging (started by the browser).")
+        native_host_parser.add_argument("browser_args", nargs="*", help="Arguments passed by the browser (the calling extension)")
+        native_host_parser.set_defaults(func=native_host)
+
+    # Profile command
+    profile_parser = subparsers.add_parser("profile", help="List the profiles or switch to another one.")
+    profile_parser.add_argument("name", nargs="?", default=None, help="Profile to switch to (created on `init`); 'default' is the original database")
+    profile_parser.set_defaults(func=profile)
+
     # Help command
     help_parser = subparsers.add_parser("help", help="Help command")
     help_parser.set_defaults(func=help)
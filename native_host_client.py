@@ -0,0 +1,56 @@
+#! usr/bin/python3
+# native_host_client.py - A stand-in for the browser to try the native-messaging
+# host end to end: starts `main.py native-host`, asks it for the credentials of
+# the given origins and then times a batch of pipelined requests.
+#
+# Usage: python3 native_host_client.py ORIGIN [ORIGIN ...] [-n REQUESTS] [--show-passwords]
+#
+# The host uses the active profile and needs a live session (run any command
+# that asks for the app password first).
+
+import argparse
+import sys
+from pathlib import Path
+
+from utils.native_messaging import StubClient
+
+BULLET_UNICODE = '•'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub client for the native-messaging host")
+    parser.add_argument("origins", nargs="+", help="Origins to ask for, e.g. https://github.com")
+    parser.add_argument("-n", "--requests", type=int, default=10000, help="Number of pipelined requests to time")
+    parser.add_argument("--show-passwords", dest="show_passwords", action="store_true", help="Print the passwords instead of masking them")
+    args = parser.parse_args()
+
+    client = StubClient([sys.executable, str(Path(__file__).parent / 'main.py'), 'native-host'])
+    try:
+        ping = client.request({'type': 'ping'})
+        print(f"Host is up: {ping['entries']} websites, {'locked' if ping.get('locked') else 'unlocked'}.\n")
+
+        for origin in args.origins:
+            response = client.request({'type': 'credentials', 'origin': origin})
+            if not response['ok']:
+                print(f"{origin}: [Error] {response['error']}")
+                continue
+            print(f"{origin}: {len(response['credentials'])} credential(s)")
+            for credentials in response['credentials']:
+                password = credentials['password'] or ''
+                if not args.show_passwords:
+                    password = BULLET_UNICODE * len(password)
+                print(f"     - {credentials['url']}  {credentials['username'] or '-'}  {password}")
+
+        requests = [
+            {'type': 'credentials', 'origin': args.origins[i % len(args.origins)]}
+            for i in range(args.requests)
+        ]
+        responses, seconds = client.pipeline(requests)
+        assert [response['id'] for response in responses] == sorted(response['id'] for response in responses)
+        print(f"\n{len(responses)} pipelined requests in {seconds:.3f}s: {seconds / len(responses) * 1e6:.1f} us per request.")
+    finally:
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#! usr/bin/python3
+# session_benchmark.py - Compares the per-visit cost of getting the app key
+# from the session with the file backend and the kernel keyring backend.
+#
+# Usage: python3 session_benchmark.py [-n ITERATIONS]
+#
+# Each lookup is what `visit` does before decrypting a password: the file
+# backend reads `.session_token` and verifies its signature, the keyring
+# backend asks the kernel for the key. A throwaway app key and a temporary
+# directory are used, so the real session is left alone.
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from cryptography.fernet import Fernet
+
+from utils import kernel_keyring
+from utils.authentication import generate_session_token, save_session_token, get_existing_session_token, confirm_session_token, keyring_description
+
+
+def _time_per_call(func, iterations:int):
+    for _ in range(min(100, iterations)):
+        func()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the session backends")
+    parser.add_argument("-n", "--iterations", type=int, default=10000, help="Lookups per backend")
+    args = parser.parse_args()
+
+    app_key = Fernet.generate_key()
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        token_file = Path(tmp) / '.session_token'
+        save_session_token(token=generate_session_token(app_key), token_file=token_file)
+
+        def file_lookup():
+            return confirm_session_token(token=get_existing_session_token(token_file=token_file))
+
+        assert file_lookup() == app_key.decode()
+        results.append(("file", _time_per_call(file_lookup, args.iterations)))
+
+        description = keyring_description(Path(tmp))
+        if not kernel_keyring.is_available():
+            print("The kernel keyring is not available here; only the file backend was measured.\n")
+        elif kernel_keyring.store(description, app_key, timeout=60) is None:
+            print("Could not add a key to the kernel keyring; only the file backend was measured.\n")
+        else:
+            def keyring_lookup():
+                return kernel_keyring.read(description)
+
+            assert keyring_lookup() == app_key
+            results.append(("keyring", _time_per_call(keyring_lookup, args.iterations)))
+            kernel_keyring.remove(description)
+
+    print(f"{'Backend':<10} {'Per lookup':>12}")
+    for backend, seconds in results:
+        print(f"{backend:<10} {seconds * 1e6:>9.1f} us")
+    if len(results) == 2:
+        print(f"\nThe keyring backend is {results[0][1] / results[1][1]:.1f}x faster.")
+
+
+if __name__ == '__main__':
+    main()
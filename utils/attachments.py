@@ -0,0 +1,323 @@
+# Encrypted file attachments for WebPassAccess
+# Author: Indrajit Ghosh
+# Created On: Oct 19, 2026
+#
+# Attachments (recovery codes, SSH keys, scanned documents, ...) are stored
+# under APP_DATA_DIR/attachments, one file per attachment, encrypted in fixed
+# size chunks with AES-GCM under a per-attachment key derived from the app
+# key. Adding and extracting stream one chunk at a time, so memory use does
+# not depend on the size of the file.
+#
+# File layout:
+#   header: MAGIC | chunk size (4 bytes) | attachment id (16 bytes)
+#   chunks: index (4) | ciphertext length (4) | final flag (1) | GCM tag (16) | ciphertext
+#
+# The nonce of a chunk is derived from its index and the associated data binds
+# the chunk to the attachment id, its index and whether it is the last one, so
+# chunks cannot be reordered, swapped between files or cut off. The digest of
+# all chunk headers is kept in the website entry; `verify_attachment` compares
+# it by reading only the headers, `deep=True` also decrypts every chunk.
+#
+# `copy_attachment` moves an attachment into the store of another vault (see
+# utils.sync); under a different app key every chunk is re-encrypted, which
+# keeps the id but changes the digest.
+#
+
+# Standard library imports
+import base64
+import hashlib
+import os
+import secrets
+import shutil
+import struct
+from pathlib import Path
+
+# Third-party imports
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+# Local imports
+from utils.common import atomic_write
+
+MAGIC = b'WPAATT01'
+HEADER = struct.Struct('>8sI16s')
+CHUNK_HEADER = struct.Struct('>IIB16s')
+CHUNK_SIZE = 64 * 1024
+TAG_SIZE = 16
+
+
+class AttachmentError(Exception):
+    """Raised when an attachment is missing, malformed or fails authentication."""
+    pass
+
+
+def _attachment_cipher(app_key, raw_id:bytes):
+    """Returns the AES-GCM cipher of one attachment. The key is unique per attachment id."""
+    if isinstance(app_key, str):
+        app_key = app_key.encode()
+    key = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=raw_id,
+        info=b'webpassaccess-attachments'
+    ).derive(base64.urlsafe_b64decode(app_key))
+    return AESGCM(key)
+
+
+def _nonce(index:int):
+    # Unique within an attachment, and every attachment has its own key
+    return b'\x00' * 8 + struct.pack('>I', index)
+
+
+def _aad(attachment_id:bytes, index:int, final:bool):
+    return attachment_id + struct.pack('>IB', index, final)
+
+
+def attachment_path(attachments_dir, attachment_id:str):
+    return Path(attachments_dir) / f"{attachment_id}.wpa"
+
+
+def add_attachment(source_path, attachments_dir, app_key, chunk_size:int=CHUNK_SIZE):
+    """
+    Encrypt a file into the attachment store.
+
+    Args:
+        source_path (str | Path): The file to attach.
+        attachments_dir (Path): The attachment store.
+        app_key (str): The decrypted app key.
+        chunk_size (int, optional): Plaintext bytes per chunk.
+
+    Returns:
+        dict: The attachment reference to keep in the website entry: `id`,
+              `name`, `size`, `chunks` and `digest`.
+    """
+    source_path = Path(source_path)
+    attachments_dir = Path(attachments_dir)
+    attachments_dir.mkdir(parents=True, exist_ok=True)
+
+    raw_id = secrets.token_bytes(16)
+    attachment_id = raw_id.hex()
+    aesgcm = _attachment_cipher(app_key, raw_id)
+    digest = hashlib.sha256()
+
+    size = 0
+    index = 0
+    with open(source_path, 'rb') as src, atomic_write(attachment_path(attachments_dir, attachment_id), 'wb') as out:
+        out.write(HEADER.pack(MAGIC, chunk_size, raw_id))
+        chunk = src.read(chunk_size)
+        while True:
+            # Read ahead to know whether this is the last chunk
+            next_chunk = src.read(chunk_size) if chunk else b''
+            final = not next_chunk
+            sealed = aesgcm.encrypt(_nonce(index), chunk, _aad(raw_id, index, final))
+            ciphertext, tag = sealed[:-TAG_SIZE], sealed[-TAG_SIZE:]
+            chunk_header = CHUNK_HEADER.pack(index, len(ciphertext), final, tag)
+            digest.update(chunk_header)
+            out.write(chunk_header)
+            out.write(ciphertext)
+            size += len(chunk)
+            index += 1
+            if final:
+                break
+            chunk = next_chunk
+
+    return {
+        'id': attachment_id,
+        'name': source_path.name,
+        'size': size,
+        'chunks': index,
+        'digest': digest.hexdigest(),
+    }
+
+
+def _iter_chunks(f, raw_id:bytes, read_body:bool):
+    """Yields `(chunk_header, index, final, tag, ciphertext)`; `ciphertext` is None unless `read_body`."""
+    expected_index = 0
+    while True:
+        chunk_header = f.read(CHUNK_HEADER.size)
+        if not chunk_header:
+            raise AttachmentError("Attachment is truncated: the last chunk is missing.")
+        if len(chunk_header) < CHUNK_HEADER.size:
+            raise AttachmentError("Attachment is truncated inside a chunk header.")
+        index, length, final, tag = CHUNK_HEADER.unpack(chunk_header)
+        if index != expected_index:
+            raise AttachmentError(f"Chunk {expected_index} is missing or out of order.")
+
+        if read_body:
+            ciphertext = f.read(length)
+            if len(ciphertext) < length:
+                raise AttachmentError(f"Chunk {index} is truncated.")
+        else:
+            ciphertext = None
+            f.seek(length, os.SEEK_CUR)
+
+        yield chunk_header, index, bool(final), tag, ciphertext
+        if final:
+            if f.read(1):
+                raise AttachmentError("Unexpected data after the last chunk.")
+            return
+        expected_index += 1
+
+
+def _open_attachment(attachments_dir, reference:dict):
+    path = attachment_path(attachments_dir, reference['id'])
+    if not path.exists():
+        raise AttachmentError(f"Attachment file '{path.name}' is missing.")
+    f = open(path, 'rb')
+    magic, _, raw_id = HEADER.unpack(f.read(HEADER.size).ljust(HEADER.size, b'\0'))
+    if magic != MAGIC or raw_id.hex() != reference['id']:
+        f.close()
+        raise AttachmentError(f"'{path.name}' is not the attachment it should be.")
+    return f, raw_id
+
+
+def extract_attachment(reference:dict, attachments_dir, app_key, output_path):
+    """
+    Decrypt an attachment to `output_path`, one chunk at a time.
+
+    Nothing is left at `output_path` if any chunk fails authentication.
+
+    Raises:
+        AttachmentError: If the attachment is missing or has been tampered with.
+    """
+    output_path = Path(output_path)
+    tmp_path = output_path.with_name(output_path.name + '.part')
+
+    f, raw_id = _open_attachment(attachments_dir, reference)
+    aesgcm = _attachment_cipher(app_key, raw_id)
+    try:
+        with f:
+            # Attachments are usually keys and recovery codes: readable by the
+            # owner only. A leftover temporary file would keep its old mode.
+            tmp_path.unlink(missing_ok=True)
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with open(fd, 'wb') as out:
+                for _, index, final, tag, ciphertext in _iter_chunks(f, raw_id, read_body=True):
+                    try:
+                        out.write(aesgcm.decrypt(_nonce(index), ciphertext + tag, _aad(raw_id, index, final)))
+                    except InvalidTag:
+                        raise AttachmentError(f"Chunk {index} failed authentication.")
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    os.replace(tmp_path, output_path)
+
+
+def verify_attachment(reference:dict, attachments_dir, app_key=None, deep:bool=False):
+    """
+    Check an attachment against its reference.
+
+    By default only the chunk headers are read: their digest must match the
+    one recorded when the file was attached. With `deep=True` every chunk is
+    also decrypted and authenticated (this needs `app_key`).
+
+    Raises:
+        AttachmentError: Describing the first problem found.
+    """
+    digest = hashlib.sha256()
+    chunks = 0
+
+    f, raw_id = _open_attachment(attachments_dir, reference)
+    aesgcm = _attachment_cipher(app_key, raw_id) if deep else None
+    with f:
+        for chunk_header, index, final, tag, ciphertext in _iter_chunks(f, raw_id, read_body=deep):
+            digest.update(chunk_header)
+            chunks += 1
+            if deep:
+                try:
+                    aesgcm.decrypt(_nonce(index), ciphertext + tag, _aad(raw_id, index, final))
+                except InvalidTag:
+                    raise AttachmentError(f"Chunk {index} failed authentication.")
+
+    if chunks != reference['chunks'] or digest.hexdigest() != reference['digest']:
+        raise AttachmentError("Chunk headers do not match the ones recorded when the file was attached.")
+
+
+def remove_attachment(attachments_dir, attachment_id:str):
+    attachment_path(attachments_dir, attachment_id).unlink(missing_ok=True)
+
+
+def _reencrypt_chunks(f, out, raw_id:bytes, from_key, to_key):
+    """Writes the attachment read from `f` to `out` under `to_key`; returns the new digest."""
+    _, chunk_size, _ = HEADER.unpack(f.read(HEADER.size))
+    from_aesgcm = _attachment_cipher(from_key, raw_id)
+    to_aesgcm = _attachment_cipher(to_key, raw_id)
+    digest = hashlib.sha256()
+
+    out.write(HEADER.pack(MAGIC, chunk_size, raw_id))
+    for _, index, final, tag, ciphertext in _iter_chunks(f, raw_id, read_body=True):
+        aad = _aad(raw_id, index, final)
+        try:
+            chunk = from_aesgcm.decrypt(_nonce(index), ciphertext + tag, aad)
+        except InvalidTag:
+            raise AttachmentError(f"Chunk {index} failed authentication.")
+        sealed = to_aesgcm.encrypt(_nonce(index), chunk, aad)
+        ciphertext, tag = sealed[:-TAG_SIZE], sealed[-TAG_SIZE:]
+        chunk_header = CHUNK_HEADER.pack(index, len(ciphertext), final, tag)
+        digest.update(chunk_header)
+        out.write(chunk_header)
+        out.write(ciphertext)
+    return digest.hexdigest()
+
+
+def copy_attachment(reference:dict, from_dir, to_dir, from_key, to_key):
+    """
+    Copy an attachment into another attachment store.
+
+    The file is copied as it is if both stores use the same app key, otherwise
+    every chunk is decrypted and encrypted again under `to_key`.
+
+    Returns:
+        dict: The reference for the receiving store (the digest changes when
+              the chunks are re-encrypted).
+
+    Raises:
+        AttachmentError: If the attachment is missing or has been tampered with.
+    """
+    to_dir = Path(to_dir)
+    to_dir.mkdir(parents=True, exist_ok=True)
+
+    f, raw_id = _open_attachment(from_dir, reference)
+    digest = None
+    with f, atomic_write(attachment_path(to_dir, reference['id']), 'wb') as out:
+        f.seek(0)
+        if from_key == to_key:
+            shutil.copyfileobj(f, out)
+        else:
+            digest = _reencrypt_chunks(f, out, raw_id, from_key, to_key)
+
+    return dict(reference, digest=digest) if digest else dict(reference)
+
+
+def strip_missing_attachments(websites:dict, attachments_dir):
+    """
+    Drop the references whose attachment file does not exist.
+
+    Returns:
+        list: `(url, name)` of every reference dropped.
+    """
+    stripped = []
+    for website in websites.values():
+        references = website.get('attachments')
+        if not references:
+            continue
+        present = [a for a in references if attachment_path(attachments_dir, a['id']).exists()]
+        stripped += [(website['url'], a['name']) for a in references if a not in present]
+        if len(present) < len(references):
+            if present:
+                website['attachments'] = present
+            else:
+                website.pop('attachments')
+    return stripped
+
+
+def orphan_attachments(websites:dict, attachments_dir):
+    """Returns the sorted paths of the attachment files no website refers to."""
+    referenced = {a['id'] for website in websites.values() for a in website.get('attachments', [])}
+    return sorted(
+        path for path in Path(attachments_dir).glob('*.wpa')
+        if path.stem not in referenced
+    )
@@ -0,0 +1,163 @@
+# Vault health audit for WebPassAccess
+# Author: Indrajit Ghosh
+# Created On: Oct 19, 2026
+#
+# The audit decrypts every saved site password in parallel chunks across a
+# process pool. Each worker builds a single Fernet instance and hands back
+# only a SHA256 digest and a strength score for every password, so the
+# plaintexts never leave the worker and are never written to disk.
+#
+
+# Standard library imports
+import hashlib
+import math
+import os
+import string
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Third-party imports
+from cryptography.fernet import Fernet, InvalidToken
+
+CHUNK_SIZE = 2000
+STALE_AFTER_DAYS = 365
+WEAK_PASSWORD_BITS = 60
+
+# One Fernet instance per worker process, set up by `_init_worker`
+_worker_fernet = None
+
+
+def _init_worker(app_key):
+    global _worker_fernet
+    _worker_fernet = Fernet(app_key)
+
+
+def password_strength(password:str):
+    """
+    Estimate the strength of a password in bits of entropy.
+
+    The estimate is `length * log2(pool)` where the pool is made up of the
+    character classes that occur in the password. The length is capped at
+    twice the number of distinct characters so that 'aaaaaaaaaaaa' does not
+    score like a random string.
+
+    Args:
+        password (str): The plaintext password.
+
+    Returns:
+        float: The estimated entropy in bits.
+    """
+    if not password:
+        return 0.0
+
+    pool = 0
+    if any(c in string.ascii_lowercase for c in password):
+        pool += 26
+    if any(c in string.ascii_uppercase for c in password):
+        pool += 26
+    if any(c in string.digits for c in password):
+        pool += 10
+    if any(c in string.punctuation for c in password):
+        pool += len(string.punctuation)
+    if any(not c.isascii() or c.isspace() for c in password):
+        pool += 100
+
+    length = min(len(password), 2 * len(set(password)))
+    return length * math.log2(pool)
+
+
+def _audit_chunk(chunk):
+    """
+    Decrypt a chunk of `(url_hash, encrypted_password)` pairs inside a worker.
+
+    Returns:
+        list: `(url_hash, digest, bits)` tuples. `digest` and `bits` are None
+              if the token could not be decrypted with the app key.
+    """
+    results = []
+    for url_hash, token in chunk:
+        try:
+            password = _worker_fernet.decrypt(token).decode()
+        except InvalidToken:
+            results.append((url_hash, None, None))
+            continue
+        digest = hashlib.sha256(password.encode()).digest()
+        results.append((url_hash, digest, password_strength(password)))
+    return results
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def run_audit(user_data, secrets, app_key, workers:int=None, stale_after_days:int=STALE_AFTER_DAYS,
+              weak_bits:float=WEAK_PASSWORD_BITS, chunk_size:int=CHUNK_SIZE):
+    """
+    Audit all saved passwords for reuse, weakness and staleness.
+
+    Args:
+        user_data (dict): The data returned by `get_user_data()`.
+        secrets (SecretStore): The store holding the encrypted passwords.
+        app_key (str): The decrypted app key.
+        workers (int, optional): Number of worker processes. Defaults to the CPU count.
+        stale_after_days (int, optional): Passwords not changed for this many days are stale.
+        weak_bits (float, optional): Passwords scoring below this many bits are weak.
+        chunk_size (int, optional): Number of entries sent to a worker at once.
+
+    Returns:
+        dict: The audit report.
+    """
+    websites = user_data.get('websites', {})
+    items = [
+        (url_hash, record['password'])
+        for url_hash, record in secrets.items()
+        if url_hash in websites and record.get('password')
+    ]
+
+    if len(items) <= chunk_size:
+        # Not worth the cost of starting a pool
+        _init_worker(app_key)
+        results = _audit_chunk(items)
+    else:
+        results = []
+        with ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count(),
+            initializer=_init_worker,
+            initargs=(app_key,)
+        ) as executor:
+            for chunk_results in executor.map(_audit_chunk, _chunks(items, chunk_size)):
+                results.extend(chunk_results)
+
+    by_digest = {}
+    weak = []
+    undecryptable = []
+    for url_hash, digest, bits in results:
+        url = websites[url_hash]['url']
+        if digest is None:
+            undecryptable.append(url)
+            continue
+        by_digest.setdefault(digest, []).append(url)
+        if bits < weak_bits:
+            weak.append((url, bits))
+
+    now = time.time()
+    stale_after = stale_after_days * 24 * 3600
+    stale = []
+    undated = []
+    for url_hash, _ in items:
+        changed_on = websites[url_hash].get('password_modified')
+        if changed_on is None:
+            undated.append(websites[url_hash]['url'])
+        elif now - changed_on > stale_after:
+            stale.append((websites[url_hash]['url'], int((now - changed_on) // (24 * 3600))))
+
+    return {
+        'total': len(websites),
+        'with_password': len(items),
+        'reused': [sorted(urls) for urls in by_digest.values() if len(urls) > 1],
+        'weak': sorted(weak, key=lambda x: x[1]),
+        'stale': sorted(stale, key=lambda x: -x[1]),
+        'undated': undated,
+        'undecryptable': undecryptable,
+    }
@@ -10,6 +10,8 @@ Session tokens are used for user authentication and authorization in secure appl
 Functions:
     - get_session_token(master_passwd_hash): Generates a session token using the provided master password hash.
     - confirm_session_token(token, expiration): Confirms the validity of a session token within a specified expiration time.
+    - start_session(app_key, app_data_dir): Remembers the app key, in the kernel keyring if possible, else in a session token file.
+    - get_session_app_key(app_data_dir): Returns the app key of a live session, or None.
 
 Usage Example:
     1. Generate a session token using the user's master password hash.
@@ -25,8 +27,9 @@ Note: Ensure to keep the SECRET_KEY secret and protect session tokens from unaut
 from itsdangerous import URLSafeTimedSerializer
 import itsdangerous
 import pwinput
-from config import SECRET_KEY, DOT_SESSION_TOKEN_FILE, SESSION_TOKEN_EXPIRATION_IN_SECONDS
+from config import SECRET_KEY, APP_DATA_DIR, DOT_SESSION_TOKEN_FILE, SESSION_TOKEN_EXPIRATION_IN_SECONDS, SESSION_BACKEND
 from utils.encryption import sha256
+from utils import kernel_keyring
 
 SALT = "terminal_session_token_from_user_master_passwd_hash"
 EXPIRATION = SESSION_TOKEN_EXPIRATION_IN_SECONDS
@@ -37,7 +40,8 @@ def get_password(info_msg:str="Enter your password: ", success_msg:str="Password
         password1 = pwinput.pwinput(info_msg, mask=bullet_unicode)
         password2 = input("Confirm your password: ")
         if password1 == password2:
-            print(success_msg)
+            if success_msg is not None:
+                print(success_msg)
             return password1
         else:
             print("Passwords do not match. Please try again.")
@@ -90,17 +94,50 @@ def confirm_session_token(token: str, expiration: int = EXPIRATION):
         return None  # Invalid token
 
 
-def save_session_token(token:str):
+def save_session_token(token:str, token_file=DOT_SESSION_TOKEN_FILE):
     """Save the session token"""
-    with open(DOT_SESSION_TOKEN_FILE, 'w') as f:
+    with open(token_file, 'w') as f:
         f.write(token)
 
-def get_existing_session_token():
-    """Get the existing session token from the file"""
-    if not DOT_SESSION_TOKEN_FILE.exists():
+def get_existing_session_token(token_file=DOT_SESSION_TOKEN_FILE):
+    """Get the existing session token from the file (of the active profile by default)"""
+    if not token_file.exists():
         return None
     
-    with open(DOT_SESSION_TOKEN_FILE, 'r') as f:
+    with open(token_file, 'r') as f:
         return f.read()
 
 
+def keyring_description(app_data_dir):
+    """Returns the name of the kernel keyring key holding the session of `app_data_dir` (one per profile)."""
+    return "webpassaccess:" + sha256(str(app_data_dir))[:16]
+
+def _use_keyring():
+    return SESSION_BACKEND == 'keyring' and kernel_keyring.is_available()
+
+def start_session(app_key, app_data_dir=APP_DATA_DIR):
+    """
+    Remember the decrypted app key for SESSION_TOKEN_EXPIRATION_IN_SECONDS.
+
+    With the keyring backend the key is kept in the kernel session keyring and
+    any session token file is removed; otherwise a session token is saved.
+    """
+    if isinstance(app_key, str):
+        app_key = app_key.encode()
+    token_file = app_data_dir / DOT_SESSION_TOKEN_FILE.name
+
+    if _use_keyring() and kernel_keyring.store(keyring_description(app_data_dir), app_key, EXPIRATION) is not None:
+        token_file.unlink(missing_ok=True)
+        return
+
+    save_session_token(token=generate_session_token(app_key), token_file=token_file)
+
+def get_session_app_key(app_data_dir=APP_DATA_DIR):
+    """Returns the app key of the live session of `app_data_dir`, or None if there is none."""
+    if _use_keyring():
+        app_key = kernel_keyring.read(keyring_description(app_data_dir))
+        if app_key is not None:
+            return app_key.decode()
+
+    token = get_existing_session_token(token_file=app_data_dir / DOT_SESSION_TOKEN_FILE.name)
+    return confirm_session_token(token=token) if token else None
@@ -0,0 +1,199 @@
+# Incremental snapshot backups for WebPassAccess
+# Author: Indrajit Ghosh
+# Created On: Oct 19, 2026
+#
+# Every website entry, together with its secret record from the
+# SecretStore, is stored once as an encrypted, content-addressed chunk. A
+# snapshot is a small encrypted manifest listing the chunk ids of the entries
+# at that point in time, so an entry that did not change between two
+# snapshots costs nothing extra.
+#
+# Layout under BACKUP_DIR:
+#   chunks/<id[:2]>/<id>      Fernet encrypted JSON of one entry
+#   snapshots/<epoch_ms>.snap Fernet encrypted manifest
+#
+# Chunk ids are an HMAC of the entry keyed with the app key, so the file names
+# reveal nothing about the entries themselves.
+#
+
+# Standard library imports
+import hashlib
+import hmac
+import json
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Third-party imports
+from cryptography.fernet import Fernet
+
+# Local imports
+from utils.common import atomic_write, canonical_json
+
+
+class SnapshotStore:
+    """
+    Content-addressed, encrypted snapshot store for the user data.
+
+    Args:
+        backup_dir (Path): The root directory of the store.
+        app_key (str | bytes): The decrypted app key.
+    """
+    def __init__(self, backup_dir, app_key):
+        if isinstance(app_key, str):
+            app_key = app_key.encode()
+        self.backup_dir = Path(backup_dir)
+        self.chunks_dir = self.backup_dir / 'chunks'
+        self.snapshots_dir = self.backup_dir / 'snapshots'
+        self._fernet = Fernet(app_key)
+        self._mac_key = hashlib.sha256(b'wpa-backup-chunk-id' + app_key).digest()
+
+    def _chunk_path(self, chunk_id:str):
+        return self.chunks_dir / chunk_id[:2] / chunk_id
+
+    def _put_chunk(self, payload:bytes):
+        """
+        Stores `payload` unless a chunk with the same content exists.
+
+        Returns:
+            tuple: `(chunk_id, created)`
+        """
+        chunk_id = hmac.new(self._mac_key, payload, hashlib.sha256).hexdigest()
+        path = self._chunk_path(chunk_id)
+        if path.exists():
+            return chunk_id, False
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_write(path, 'wb') as f:
+            f.write(self._fernet.encrypt(payload))
+        return chunk_id, True
+
+    def _get_chunk(self, chunk_id:str):
+        with open(self._chunk_path(chunk_id), 'rb') as f:
+            return json.loads(self._fernet.decrypt(f.read()))
+
+    def list_snapshots(self):
+        """Returns the snapshot timestamps (epoch seconds), oldest first."""
+        if not self.snapshots_dir.exists():
+            return []
+        return sorted(int(p.stem) / 1000 for p in self.snapshots_dir.glob('*.snap'))
+
+    def _snapshot_path(self, timestamp:float):
+        return self.snapshots_dir / f"{int(round(timestamp * 1000))}.snap"
+
+    def _load_manifest(self, timestamp:float):
+        with open(self._snapshot_path(timestamp), 'rb') as f:
+            return json.loads(self._fernet.decrypt(f.read()))
+
+    def snapshot(self, user_data:dict, secrets):
+        """
+        Take a snapshot of `user_data` and the secrets of its entries.
+
+        Args:
+            user_data (dict): The data returned by `get_user_data()`.
+            secrets (SecretStore): The store holding the encrypted passwords.
+
+        Returns:
+            tuple: `(timestamp, new_chunks)`. `timestamp` is None if nothing has
+                   changed since the latest snapshot.
+        """
+        new_chunks = 0
+        entries = []
+        for url_hash, website in user_data.get('websites', {}).items():
+            record = secrets.get(url_hash)
+            if record:
+                website = dict(website, secret=record)
+            chunk_id, created = self._put_chunk(canonical_json(website))
+            entries.append([url_hash, chunk_id])
+            new_chunks += created
+        meta = {k: v for k, v in user_data.items() if k != 'websites'}
+        manifest = {'meta': meta, 'entries': entries}
+
+        snapshots = self.list_snapshots()
+        if snapshots:
+            latest = self._load_manifest(snapshots[-1])
+            if latest['meta'] == meta and latest['entries'] == entries:
+                return None, new_chunks
+
+        timestamp = time.time()
+        if snapshots and timestamp <= snapshots[-1]:
+            timestamp = snapshots[-1] + 0.001
+        manifest['created_on'] = timestamp
+        self.snapshots_dir.mkdir(parents=True, exist_ok=True)
+        with atomic_write(self._snapshot_path(timestamp), 'wb') as f:
+            f.write(self._fernet.encrypt(canonical_json(manifest)))
+
+        return timestamp, new_chunks
+
+    def snapshot_at(self, at:float=None):
+        """Returns the timestamp of the latest snapshot taken at or before `at`, or None."""
+        candidates = [t for t in self.list_snapshots() if at is None or t <= at]
+        return candidates[-1] if candidates else None
+
+    def restore(self, timestamp:float):
+        """
+        Rebuilds the user data saved in the snapshot taken at `timestamp`.
+
+        Returns:
+            tuple: `(user_data, secrets)` where `secrets` maps url hashes to
+                   their secret records.
+        """
+        manifest = self._load_manifest(timestamp)
+        user_data = dict(manifest['meta'])
+        user_data['websites'] = {}
+        secrets = {}
+        for url_hash, chunk_id in manifest['entries']:
+            website = self._get_chunk(chunk_id)
+            record = website.pop('secret', None)
+            if record:
+                secrets[url_hash] = record
+            user_data['websites'][url_hash] = website
+        return user_data, secrets
+
+    def prune(self, keep_last:int, keep_daily:int, keep_weekly:int, now:float=None):
+        """
+        Apply the retention policy and garbage-collect unreferenced chunks.
+
+        A snapshot is kept if it is one of the `keep_last` newest, or the newest
+        snapshot of one of the last `keep_daily` days, or the newest snapshot of
+        one of the last `keep_weekly` weeks.
+
+        Returns:
+            tuple: `(removed_snapshots, removed_chunks)`
+        """
+        now = now or time.time()
+        snapshots = self.list_snapshots()
+        keep = set(snapshots[-keep_last:] if keep_last > 0 else [])
+
+        today = datetime.fromtimestamp(now).date()
+        daily_cutoff = today - timedelta(days=keep_daily)
+        weekly_cutoff = today - timedelta(weeks=keep_weekly)
+        newest_per_day = {}
+        newest_per_week = {}
+        for timestamp in snapshots:
+            day = datetime.fromtimestamp(timestamp).date()
+            if day > daily_cutoff:
+                newest_per_day[day] = timestamp
+            if day > weekly_cutoff:
+                newest_per_week[day.isocalendar()[:2]] = timestamp
+        keep.update(newest_per_day.values())
+        keep.update(newest_per_week.values())
+
+        removed_snapshots = 0
+        for timestamp in snapshots:
+            if timestamp not in keep:
+                self._snapshot_path(timestamp).unlink()
+                removed_snapshots += 1
+
+        # Mark and sweep
+        referenced = set()
+        for timestamp in keep:
+            referenced.update(chunk_id for _, chunk_id in self._load_manifest(timestamp)['entries'])
+
+        removed_chunks = 0
+        if self.chunks_dir.exists():
+            for path in self.chunks_dir.glob('*/*'):
+                if path.name not in referenced:
+                    path.unlink()
+                    removed_chunks += 1
+
+        return removed_snapshots, removed_chunks
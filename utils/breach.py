@@ -0,0 +1,278 @@
+# Offline breached-password lookup for WebPassAccess
+# Author: Indrajit Ghosh
+# Created On: Oct 19, 2026
+#
+# The breach corpus (HIBP-style SHA1 lists) is converted once into a sorted
+# binary index of fixed-width records: a 20 byte SHA1 digest followed by a
+# 4 byte big-endian breach count. Lookups `mmap` the index and binary-search
+# it, so a check touches only a handful of pages and no network is needed.
+#
+# Supported corpus layouts:
+#   - a single text file with lines `<40 hex SHA1>:<count>`
+#   - a directory of range files named by their 5 hex prefix, each with
+#     lines `<35 hex suffix>:<count>` (the layout the HIBP downloader writes)
+#
+# A single file is sorted in runs that are merged on disk, at most
+# MERGE_FAN_IN runs at a time so the number of open files stays bounded. A
+# directory of range files is already partitioned by prefix: the files are
+# read in prefix order and each one is sorted on its own, with no runs at all.
+#
+
+# Standard library imports
+import hashlib
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+from pathlib import Path
+
+# Third-party imports
+from cryptography.fernet import Fernet, InvalidToken
+
+# Local imports
+from utils.common import atomic_write
+
+MAGIC = b'WPABRX01'
+DIGEST_SIZE = 20
+RECORD = struct.Struct('>20sI')
+RECORD_SIZE = RECORD.size
+RUN_SIZE = 1_000_000  # Records sorted in memory at once while building
+MERGE_FAN_IN = 64  # Runs merged at once
+RANGE_PREFIX_LENGTH = 5
+
+
+def _parse_line(line:str, prefix:str=''):
+    line = line.strip()
+    if not line:
+        return None
+    hash_part, _, count = line.partition(':')
+    hex_digest = prefix + hash_part.strip()
+    if len(hex_digest) != 2 * DIGEST_SIZE:
+        return None
+    try:
+        digest = bytes.fromhex(hex_digest)
+    except ValueError:
+        return None
+    count = int(count) if count.strip().isdigit() else 0
+    return RECORD.pack(digest, min(count, 0xFFFFFFFF))
+
+
+def _iter_range_files(corpus_path:Path):
+    """Yields packed records in digest order from a directory of range files."""
+    range_files = {}
+    for range_file in corpus_path.iterdir():
+        prefix = range_file.stem.upper()
+        if range_file.is_file() and len(prefix) == RANGE_PREFIX_LENGTH and all(c in '0123456789ABCDEF' for c in prefix):
+            range_files[prefix] = range_file
+
+    for prefix in sorted(range_files):
+        with open(range_files[prefix], 'r') as f:
+            records = [record for record in (_parse_line(line, prefix=prefix) for line in f) if record]
+        # A range file holds about a thousand lines; sorting it costs nothing
+        records.sort()
+        yield from records
+
+
+def _iter_corpus_file(corpus_path:Path):
+    """Yields packed records from a corpus file, in file order."""
+    with open(corpus_path, 'r') as f:
+        for line in f:
+            record = _parse_line(line)
+            if record:
+                yield record
+
+
+def _write_run(records, directory):
+    records.sort()
+    fd, run_path = tempfile.mkstemp(suffix='.run', dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(b''.join(records))
+    return run_path
+
+
+def _read_run(run_path):
+    with open(run_path, 'rb') as f:
+        while True:
+            record = f.read(RECORD_SIZE)
+            if len(record) < RECORD_SIZE:
+                return
+            yield record
+
+
+def _merge_runs(run_paths, directory):
+    """Merges sorted runs into a single new run and removes them."""
+    fd, merged_path = tempfile.mkstemp(suffix='.run', dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        for record in heapq.merge(*[_read_run(p) for p in run_paths]):
+            f.write(record)
+    for run_path in run_paths:
+        os.remove(run_path)
+    return merged_path
+
+
+def _sorted_runs(records, directory, run_size:int, fan_in:int):
+    """
+    Sort `records` on disk.
+
+    Returns:
+        list: At most `fan_in` sorted run files that together hold every record.
+    """
+    run_paths = []
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= run_size:
+            run_paths.append(_write_run(batch, directory))
+            batch = []
+    if batch or not run_paths:
+        run_paths.append(_write_run(batch, directory))
+
+    # Merge in passes so no more than `fan_in` runs are ever open at once
+    while len(run_paths) > fan_in:
+        run_paths = [
+            _merge_runs(run_paths[i:i + fan_in], directory)
+            for i in range(0, len(run_paths), fan_in)
+        ]
+    return run_paths
+
+
+def _write_unique(records, out):
+    """Writes sorted `records` to `out`, collapsing duplicate digests. Returns the number written."""
+    written = 0
+    previous = None
+    for record in records:
+        if previous is not None and previous[:DIGEST_SIZE] == record[:DIGEST_SIZE]:
+            # Records sort by count too, so the later one is larger
+            previous = record
+            continue
+        if previous is not None:
+            out.write(previous)
+            written += 1
+        previous = record
+    if previous is not None:
+        out.write(previous)
+        written += 1
+    return written
+
+
+def build_breach_index(corpus_path, index_path, run_size:int=RUN_SIZE, fan_in:int=MERGE_FAN_IN):
+    """
+    Convert a text breach corpus into a sorted fixed-width binary index.
+
+    A corpus file is sorted in runs of `run_size` that are merged on disk, so
+    memory use and open files stay bounded however large the corpus is. A
+    directory of range files is streamed in prefix order without any runs.
+    Duplicate digests are collapsed, keeping the largest count.
+
+    Args:
+        corpus_path (str | Path): The corpus file or directory of range files.
+        index_path (str | Path): Where to write the index.
+        run_size (int, optional): Number of records sorted in memory at once.
+        fan_in (int, optional): Number of runs merged at once.
+
+    Returns:
+        int: The number of records written.
+    """
+    corpus_path = Path(corpus_path)
+    index_path = Path(index_path)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with tempfile.TemporaryDirectory(dir=index_path.parent) as tmp_dir:
+        if corpus_path.is_dir():
+            records = _iter_range_files(corpus_path)
+        else:
+            run_paths = _sorted_runs(_iter_corpus_file(corpus_path), tmp_dir, run_size, fan_in)
+            records = heapq.merge(*[_read_run(p) for p in run_paths])
+
+        with atomic_write(index_path, 'wb') as out:
+            out.write(MAGIC)
+            written = _write_unique(records, out)
+
+    return written
+
+
+class BreachIndex:
+    """
+    Read-only view of a breach index built by `build_breach_index`.
+
+    Usage:
+        with BreachIndex(BREACH_INDEX_FILE) as index:
+            times_seen = index.count(password)
+    """
+    def __init__(self, index_path):
+        self._file = open(index_path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"Breach index '{index_path}' is empty.")
+
+        if self._mm[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"'{index_path}' is not a breach index.")
+        self._n = (len(self._mm) - len(MAGIC)) // RECORD_SIZE
+
+    def __len__(self):
+        return self._n
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def count_digest(self, digest:bytes):
+        """Returns the breach count for a raw SHA1 digest, 0 if not found."""
+        mm = self._mm
+        lo, hi = 0, self._n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = len(MAGIC) + mid * RECORD_SIZE
+            probe = mm[offset:offset + DIGEST_SIZE]
+            if probe < digest:
+                lo = mid + 1
+            elif probe > digest:
+                hi = mid
+            else:
+                return RECORD.unpack_from(mm, offset)[1]
+        return 0
+
+    def count(self, password:str):
+        """Returns how many times `password` appears in the breach corpus."""
+        return self.count_digest(hashlib.sha1(password.encode()).digest())
+
+
+def check_vault(user_data, secrets, app_key, index:BreachIndex):
+    """
+    Check every saved site password against the breach index.
+
+    Args:
+        user_data (dict): The data returned by `get_user_data()`.
+        secrets (SecretStore): The store holding the encrypted passwords.
+        app_key (str): The decrypted app key.
+        index (BreachIndex): An open breach index.
+
+    Returns:
+        list: `(url, count)` for every breached password, most seen first.
+    """
+    fernet = Fernet(app_key)
+    breached = []
+    websites = user_data.get('websites', {})
+    for url_hash, record in secrets.items():
+        token = record.get('password')
+        if url_hash not in websites or not token:
+            continue
+        try:
+            password = fernet.decrypt(token).decode()
+        except InvalidToken:
+            continue
+        count = index.count(password)
+        if count:
+            breached.append((websites[url_hash]['url'], count))
+
+    return sorted(breached, key=lambda x: -x[1])
@@ -0,0 +1,143 @@
+# Bulk edits for WebPassAccess
+# Author: Indrajit Ghosh
+# Created On: Oct 19, 2026
+#
+# `bulk` selects website entries with a key glob, a domain and/or a username
+# regex (all given selectors must match) and plans one set of operations for
+# all of them. Planning works on copies, so the caller can preview the plan
+# and then apply it with a single write of the vault.
+#
+
+# Standard library imports
+import copy
+import fnmatch
+import re
+
+# Local imports
+from utils.common import url_domain
+from utils.tag_index import normalize_tag
+
+
+def domain_matches(host:str, domain:str):
+    """Whether `host` is `domain` or one of its subdomains."""
+    domain = domain.lower().strip('.')
+    return host == domain or host.endswith('.' + domain)
+
+
+def select_websites(websites:dict, key_glob:str=None, domain:str=None, username_regex:str=None, url_hashes=None):
+    """
+    Select the website entries matching every given selector.
+
+    Args:
+        websites (dict): `user_data['websites']`.
+        key_glob (str, optional): Shell-style pattern one of the keys must match, e.g. 'old-*'.
+        domain (str, optional): The url must be on this domain or a subdomain of it.
+        username_regex (str, optional): Regular expression searched in the username.
+        url_hashes (iterable, optional): Only consider these entries (e.g. the result of a tag query).
+
+    Returns:
+        list: The url hashes of the matching entries, in vault order.
+
+    Raises:
+        re.error: If `username_regex` is not a valid regular expression.
+    """
+    username_pattern = re.compile(username_regex) if username_regex is not None else None
+    allowed = set(url_hashes) if url_hashes is not None else None
+
+    selected = []
+    for url_hash, website_info in websites.items():
+        if allowed is not None and url_hash not in allowed:
+            continue
+        if key_glob is not None and not any(fnmatch.fnmatchcase(key, key_glob) for key in website_info['keys']):
+            continue
+        if domain is not None and not domain_matches(url_domain(website_info['url']), domain):
+            continue
+        if username_pattern is not None and not username_pattern.search(website_info.get('username') or ''):
+            continue
+        selected.append(url_hash)
+    return selected
+
+
+def _edit_keys(keys, add_keys, remove_keys, rename_key_prefix):
+    if rename_key_prefix is not None:
+        old_prefix, new_prefix = rename_key_prefix
+        keys = [new_prefix + key[len(old_prefix):] if key.startswith(old_prefix) else key for key in keys]
+    keys = [key for key in keys if not any(fnmatch.fnmatchcase(key, pattern) for pattern in remove_keys)]
+    # Keep the original order and drop duplicates
+    return list(dict.fromkeys(keys + list(add_keys)))
+
+
+def plan_changes(websites:dict, url_hashes, add_keys=(), remove_keys=(), rename_key_prefix=None,
+                 set_username=None, add_tags=(), remove_tags=(), delete:bool=False):
+    """
+    Work out what the operations do to each selected entry.
+
+    Args:
+        websites (dict): `user_data['websites']`. It is not modified.
+        url_hashes (iterable): The selected entries.
+        add_keys (iterable, optional): Keys to add.
+        remove_keys (iterable, optional): Keys (or shell-style patterns) to remove.
+        rename_key_prefix (tuple, optional): `(old, new)`: keys starting with `old` start with `new` instead.
+        set_username (str, optional): New username; an empty string removes it.
+        add_tags (iterable, optional): Tags to add.
+        remove_tags (iterable, optional): Tags to remove.
+        delete (bool, optional): Delete the entries instead.
+
+    Returns:
+        list: One dict per entry that changes, with the keys `url_hash`,
+              `before` and `after` (None when the entry is deleted).
+
+    Raises:
+        ValueError: If an entry would be left without any key.
+    """
+    add_tags = {normalize_tag(tag) for tag in add_tags}
+    remove_tags = {normalize_tag(tag) for tag in remove_tags}
+
+    changes = []
+    for url_hash in url_hashes:
+        before = websites[url_hash]
+        if delete:
+            changes.append({'url_hash': url_hash, 'before': before, 'after': None})
+            continue
+
+        after = copy.deepcopy(before)
+        after['keys'] = _edit_keys(before['keys'], add_keys, remove_keys, rename_key_prefix)
+        if not after['keys']:
+            raise ValueError(f"'{before['url']}' would be left without any key.")
+
+        if set_username is not None:
+            if set_username:
+                after['username'] = set_username
+            else:
+                after.pop('username', None)
+
+        if add_tags or remove_tags:
+            tags = (set(before.get('tags', [])) | add_tags) - remove_tags
+            if tags:
+                after['tags'] = sorted(tags)
+            else:
+                after.pop('tags', None)
+
+        if after != before:
+            changes.append({'url_hash': url_hash, 'before': before, 'after': after})
+
+    return changes
+
+
+def shared_keys(websites:dict, changes):
+    """Returns `{key: number of websites}` for the keys `changes` add that more than one website would have."""
+    changed = {change['url_hash']: change['after'] for change in changes}
+    new_keys = {
+        key
+        for change in changes if change['after'] is not None
+        for key in set(change['after']['keys']) - set(change['before']['keys'])
+    }
+
+    owners = {}
+    for url_hash, website_info in websites.items():
+        website_info = changed.get(url_hash, website_info)
+        if website_info is None:
+            continue
+        for key in new_keys.intersection(website_info['keys']):
+            owners[key] = owners.get(key, 0) + 1
+    return {key: count for key, count in sorted(owners.items()) if count > 1}
@@ -0,0 +1,58 @@
+# Shared helpers for WebPassAccess
+# Author: Indrajit Ghosh
+# Created On: Oct 19, 2026
+#
+# Small file and data helpers used across the utils modules.
+#
+
+# Standard library imports
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlparse
+
+
+@contextmanager
+def atomic_write(path, mode:str='w'):
+    """
+    Open `path` for writing through a temporary file next to it.
+
+    The temporary file replaces `path` once the block completes, so an
+    interrupted write never leaves a truncated file behind. If the block
+    raises, the temporary file is removed and `path` is left as it was.
+
+    Usage:
+        with atomic_write(path) as f:
+            json.dump(data, f)
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + '.tmp')
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    os.replace(tmp_path, path)
+
+
+def file_stamp(path):
+    """Returns `[mtime in ns, size]` of a file, or None if it does not exist. Used to tell whether a file changed."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def canonical_json(obj):
+    """Returns `obj` as compact JSON bytes with sorted keys, the same for equal objects."""
+    return json.dumps(obj, sort_keys=True, separators=(',', ':')).encode()
+
+
+def url_domain(url:str):
+    """Returns the lower-case host name of a url ('' if it has none)."""
+    if '://' not in url:
+        url = '//' + url
+    return (urlparse(url).hostname or '').lower()
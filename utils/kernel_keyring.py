@@ -0,0 +1,147 @@
+# Linux kernel keyring access for WebPassAccess
+# Author: Indrajit Ghosh
+# Created On: Oct 19, 2026
+#
+# A minimal ctypes binding to the add_key(2), request_key(2) and keyctl(2)
+# system calls, so no extra library (libkeyutils) is needed. Keys are of the
+# "user" type and linked into the session keyring: they live in kernel memory
+# only, are readable by the processes of the login session and are dropped by
+# the kernel once their timeout expires.
+#
+# A shell started without a session keyring (no pam_keyinit) falls back to the
+# per-user session keyring. The keyring is resolved without the create flag
+# before adding a key; otherwise the kernel would give the process a fresh
+# anonymous session keyring that disappears when it exits.
+#
+# Everything here fails softly: if the platform has no keyrings (not Linux,
+# an unknown architecture, or a container whose seccomp profile blocks the
+# calls) `is_available()` is False and the functions return None.
+#
+
+# Standard library imports
+import ctypes
+import errno
+import os
+import platform
+import sys
+
+# (add_key, request_key, keyctl) system call numbers
+_SYSCALL_NUMBERS = {
+    'x86_64': (248, 249, 250),
+    'amd64': (248, 249, 250),
+    'aarch64': (217, 218, 219),
+    'arm64': (217, 218, 219),
+    'i386': (286, 287, 288),
+    'i686': (286, 287, 288),
+    'armv7l': (309, 310, 311),
+}
+
+KEY_SPEC_SESSION_KEYRING = -3
+
+KEYCTL_GET_KEYRING_ID = 0
+KEYCTL_READ = 11
+KEYCTL_SET_TIMEOUT = 15
+KEYCTL_INVALIDATE = 21
+
+KEY_TYPE = b'user'
+MAX_PAYLOAD = 4096
+
+_libc = None
+_numbers = None
+_available = None
+
+
+def _setup():
+    global _libc, _numbers
+    if not sys.platform.startswith('linux'):
+        return False
+    _numbers = _SYSCALL_NUMBERS.get(platform.machine().lower())
+    if _numbers is None:
+        return False
+    try:
+        _libc = ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        return False
+    _libc.syscall.restype = ctypes.c_long
+    return True
+
+
+def _syscall(number, *args):
+    """Returns the result of the system call, raising OSError on failure."""
+    result = _libc.syscall(ctypes.c_long(number), *args)
+    if result < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return result
+
+
+def _request_key(description:bytes):
+    return _syscall(_numbers[1], KEY_TYPE, description, None, ctypes.c_long(0))
+
+
+def _keyctl(operation:int, *args):
+    return _syscall(_numbers[2], ctypes.c_long(operation), *args)
+
+
+def is_available():
+    """Whether the kernel keyring can be used from this process."""
+    global _available
+    if _available is None:
+        _available = _setup()
+        if _available:
+            # Probe with a lookup that fails with ENOKEY where keyrings work,
+            # and with ENOSYS/EPERM where they are compiled out or blocked.
+            try:
+                _request_key(b'webpassaccess:probe')
+            except OSError as e:
+                _available = e.errno in (errno.ENOKEY, errno.EKEYEXPIRED, errno.EKEYREVOKED)
+    return _available
+
+
+def store(description:str, payload:bytes, timeout:int):
+    """
+    Add (or replace) a key in the session keyring.
+
+    Args:
+        description (str): Name of the key.
+        payload (bytes): The secret, at most MAX_PAYLOAD bytes.
+        timeout (int): Seconds until the kernel discards the key.
+
+    Returns:
+        int: The serial number of the key, or None if the keyring is unavailable.
+    """
+    if not is_available():
+        return None
+    try:
+        keyring = _keyctl(KEYCTL_GET_KEYRING_ID, ctypes.c_long(KEY_SPEC_SESSION_KEYRING), ctypes.c_long(0))
+        serial = _syscall(
+            _numbers[0], KEY_TYPE, description.encode(), payload,
+            ctypes.c_size_t(len(payload)), ctypes.c_int(keyring)
+        )
+        _keyctl(KEYCTL_SET_TIMEOUT, ctypes.c_long(serial), ctypes.c_long(timeout))
+    except OSError:
+        return None
+    return serial
+
+
+def read(description:str):
+    """Returns the payload of the key, or None if it does not exist or has expired."""
+    if not is_available():
+        return None
+    buffer = ctypes.create_string_buffer(MAX_PAYLOAD)
+    try:
+        serial = _request_key(description.encode())
+        length = _keyctl(KEYCTL_READ, ctypes.c_long(serial), buffer, ctypes.c_long(MAX_PAYLOAD))
+    except OSError:
+        return None
+    return buffer.raw[:length]
+
+
+def remove(description:str):
+    """Invalidates the key if it exists."""
+    if not is_available():
+        return
+    try:
+        _keyctl(KEYCTL_INVALIDATE, ctypes.c_long(_request_key(description.encode())))
+    except OSError:
+        pass
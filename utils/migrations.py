@@ -0,0 +1,338 @@
+# Vault schema versions and migrations for WebPassAccess
+# Author: Indrajit Ghosh
+# Created On: Oct 19, 2026
+#
+# `websites_data.json` carries a `schema_version`. Vaults written before it
+# existed are version 1. Each change to the layout registers a migration step
+# from one version to the next; `migrate_vault` streams the entries of the
+# vault through every pending step in a single pass, so the whole vault is
+# never held in memory and is written only once.
+#
+# Adding a migration:
+#
+#     @register_migration
+#     class AddSomething(Migration):
+#         from_version = 3
+#         description = "Add something to every entry"
+#
+#         def entry(self, url_hash, entry):
+#             entry.setdefault('something', None)
+#             return url_hash, entry
+#
+
+# Standard library imports
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+# Local imports
+from utils.secret_store import SecretStore
+
+CHUNK_SIZE = 64 * 1024
+_WHITESPACE = ' \t\n\r'
+_decoder = json.JSONDecoder()
+
+MIGRATIONS = {}
+
+
+class Migration:
+    """
+    A migration step from `from_version` to `from_version + 1`.
+
+    `entry` is called for every website entry and `meta` once for the
+    remaining top-level fields. Both default to leaving the data unchanged.
+    Steps that write files other than the vault stage them as the entries
+    arrive and put them in place in `end`, and only if `begin` was not told
+    it is a dry run.
+    """
+    from_version = None
+    description = ""
+
+    def begin(self, filepath:Path, dry_run:bool):
+        """Called before the first entry."""
+        pass
+
+    def end(self):
+        """Called after `meta`, before the migrated vault replaces the old one."""
+        pass
+
+    def entry(self, url_hash:str, entry:dict):
+        """Returns the migrated `(url_hash, entry)`, or None to drop the entry."""
+        return url_hash, entry
+
+    def meta(self, meta:dict):
+        """Returns the migrated top-level fields (everything except `websites`)."""
+        return meta
+
+
+def register_migration(cls):
+    if cls.from_version in MIGRATIONS:
+        raise ValueError(f"A migration from version {cls.from_version} is already registered.")
+    MIGRATIONS[cls.from_version] = cls()
+    return cls
+
+
+@register_migration
+class AddEntryVersions(Migration):
+    from_version = 1
+    description = "Add sync versions to every entry and the map of deleted entries"
+
+    def entry(self, url_hash, entry):
+        entry.setdefault('version', 0)
+        entry.setdefault('modified', 0)
+        return url_hash, entry
+
+    def meta(self, meta):
+        meta.setdefault('deleted', {})
+        return meta
+
+
+@register_migration
+class SplitSecrets(Migration):
+    from_version = 2
+    description = "Move the encrypted passwords out of the database into the secrets store"
+
+    def begin(self, filepath, dry_run):
+        # Passwords are written to the new store as the entries stream past
+        self.writer = None if dry_run else SecretStore.for_vault(filepath).writer()
+
+    def entry(self, url_hash, entry):
+        encrypted_password = entry.pop('password', None)
+        if encrypted_password:
+            entry['has_password'] = True
+            if self.writer is not None:
+                self.writer.add(url_hash, {'password': encrypted_password, 'history': []})
+        return url_hash, entry
+
+    def end(self):
+        if self.writer is not None:
+            self.writer.commit()
+        self.writer = None
+
+
+CURRENT_SCHEMA_VERSION = max(MIGRATIONS) + 1
+
+
+def pending_migrations(from_version:int, to_version:int=CURRENT_SCHEMA_VERSION):
+    """Returns the migration steps that take a vault from `from_version` to `to_version`."""
+    return [MIGRATIONS[version] for version in range(from_version, to_version)]
+
+
+class _StreamReader:
+    """Minimal incremental reader over a JSON text file."""
+    def __init__(self, f, chunk_size:int=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        # Read at least as much as is buffered so that a large value is
+        # re-parsed only O(log n) times
+        data = self.f.read(max(self.chunk_size, len(self.buf) - self.pos))
+        if not data:
+            self.eof = True
+            return
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+
+    def peek(self):
+        """Skips whitespace and returns the next character ('' at the end of the file)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos + 1]
+            self._fill()
+
+    def expect(self, char:str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Malformed vault: expected '{char}' but found '{found}'.")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                # A number at the end of the buffer may continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+
+def iter_vault(filepath):
+    """
+    Stream the contents of a vault file.
+
+    Yields:
+        tuple: `('entry', url_hash, entry)` for every website entry and
+               `('meta', key, value)` for every other top-level field, in
+               file order.
+    """
+    with open(filepath, 'r') as f:
+        reader = _StreamReader(f)
+        reader.expect('{')
+        if reader.peek() == '}':
+            return
+        while True:
+            key = reader.value()
+            reader.expect(':')
+            if key == 'websites':
+                reader.expect('{')
+                if reader.peek() == '}':
+                    reader.pos += 1
+                else:
+                    while True:
+                        url_hash = reader.value()
+                        reader.expect(':')
+                        yield 'entry', url_hash, reader.value()
+                        if reader.peek() == ',':
+                            reader.pos += 1
+                            continue
+                        reader.expect('}')
+                        break
+            else:
+                yield 'meta', key, reader.value()
+
+            if reader.peek() == ',':
+                reader.pos += 1
+                continue
+            reader.expect('}')
+            return
+
+
+def read_schema_version(filepath):
+    """Returns the schema version of a vault file (1 if it has none)."""
+    for kind, key, value in iter_vault(filepath):
+        # `schema_version` is written first, so this normally stops right away
+        if kind == 'meta' and key == 'schema_version':
+            return value
+    return 1
+
+
+def _indented(value, level:int):
+    return json.dumps(value, indent=4).replace('\n', '\n' + ' ' * 4 * level)
+
+
+class _CountingWriter:
+    """Stands in for the output file on a dry run."""
+    def __init__(self):
+        self.size = 0
+
+    def write(self, text:str):
+        self.size += len(text.encode())
+
+    def close(self):
+        pass
+
+
+def migrate_vault(filepath, from_version:int=None, to_version:int=CURRENT_SCHEMA_VERSION, dry_run:bool=False):
+    """
+    Upgrade a vault file to `to_version`.
+
+    The original file is copied to `<name>.v<from_version>.bak.json` first. The
+    migrated vault is written to a temporary file which then replaces the
+    original, so an interrupted migration leaves the vault untouched.
+
+    Args:
+        filepath (str | Path): The vault file.
+        from_version (int, optional): The current version, if already known.
+        to_version (int, optional): Defaults to CURRENT_SCHEMA_VERSION.
+        dry_run (bool, optional): Run every step but write nothing.
+
+    Returns:
+        dict: A report of the migration, or None if the vault is up to date.
+    """
+    filepath = Path(filepath)
+    if from_version is None:
+        from_version = read_schema_version(filepath)
+    steps = pending_migrations(from_version, to_version)
+    if not steps:
+        return None
+
+    started = time.perf_counter()
+    report = {
+        'from_version': from_version,
+        'to_version': to_version,
+        'steps': [step.description for step in steps],
+        'entries': 0,
+        'changed': 0,
+        'dropped': 0,
+        'bytes_in': filepath.stat().st_size,
+        'bytes_out': 0,
+        'backup': None,
+    }
+
+    tmp_path = filepath.with_name(filepath.name + '.migrating')
+    if dry_run:
+        out = _CountingWriter()
+    else:
+        backup_path = filepath.with_name(f"{filepath.stem}.v{from_version}.bak{filepath.suffix}")
+        shutil.copy2(filepath, backup_path)
+        report['backup'] = backup_path
+        out = open(tmp_path, 'w')
+
+    try:
+        for step in steps:
+            step.begin(filepath, dry_run)
+
+        out.write('{\n    "schema_version": %d,\n    "websites": {' % to_version)
+        meta = {}
+        first = True
+        for kind, key, value in iter_vault(filepath):
+            if kind == 'meta':
+                meta[key] = value
+                continue
+
+            report['entries'] += 1
+            before = json.dumps(value, sort_keys=True)
+            result = (key, value)
+            for step in steps:
+                result = step.entry(*result)
+                if result is None:
+                    break
+            if result is None:
+                report['dropped'] += 1
+                continue
+
+            url_hash, entry = result
+            if url_hash != key or json.dumps(entry, sort_keys=True) != before:
+                report['changed'] += 1
+            out.write(('\n' if first else ',\n') + ' ' * 8 + json.dumps(url_hash) + ': ' + _indented(entry, 2))
+            first = False
+
+        out.write('}' if first else '\n    }')
+
+        meta.pop('schema_version', None)
+        for step in steps:
+            meta = step.meta(meta)
+        for key, value in meta.items():
+            out.write(',\n    ' + json.dumps(key) + ': ' + _indented(value, 1))
+        out.write('\n}')
+
+        for step in steps:
+            step.end()
+    except BaseException:
+        out.close()
+        if not dry_run:
+            tmp_path.unlink()
+        raise
+
+    out.close()
+    if dry_run:
+        report['bytes_out'] = out.size
+    else:
+        report['bytes_out'] = tmp_path.stat().st_size
+        os.replace(tmp_path, filepath)
+
+    report['elapsed'] = time.perf_counter() - started
+    return report
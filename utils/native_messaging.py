@@ -0,0 +1,279 @@
+# Browser native-messaging host for WebPassAccess
+# Author: Indrajit Ghosh
+# Created On: Oct 19, 2026
+#
+# Browsers talk to a native-messaging host over its stdin/stdout: every
+# message is UTF-8 JSON preceded by its length as a 32-bit unsigned integer in
+# native byte order. The browser starts the host once per extension port and
+# keeps it running, so the host loads the vault once, keeps an index from
+# canonical host names to entries and a single Fernet instance, and answers
+# every request from memory. Requests are handled in the order they arrive and
+# every response echoes the request `id`, so a client may send many requests
+# without waiting for the answers.
+#
+# Requests:
+#   {"id": 1, "type": "ping"}
+#   {"id": 2, "type": "credentials", "origin": "https://mail.example.com"}
+#
+# Responses:
+#   {"id": 1, "ok": true, "locked": false, "entries": 120}
+#   {"id": 2, "ok": true, "credentials": [{"url": ..., "username": ..., "password": ..., "keys": [...]}]}
+#   {"id": 2, "ok": false, "error": "locked"}
+#
+# Credentials are looked up by canonical host (lower case, without 'www.'),
+# then by its parent domains. Credentials saved for an https url are only
+# returned to https origins.
+#
+# The app key is taken from the session (see utils.authentication) and checked
+# again on every request, so the host stops answering as soon as the session
+# expires. A changed vault file is picked up before the next request.
+#
+
+# Standard library imports
+import json
+import struct
+import subprocess
+import threading
+import time
+from urllib.parse import urlparse
+
+# Third-party imports
+from cryptography.fernet import Fernet, InvalidToken
+
+# Local imports
+from utils.common import file_stamp, url_domain
+
+LENGTH = struct.Struct('=I')
+MAX_MESSAGE_SIZE = 1024 * 1024  # Browsers refuse larger messages from a host
+PRELOAD_COUNT = 50
+
+
+def read_message(stream):
+    """
+    Returns the next message from `stream`, or None at the end of the stream.
+
+    Raises:
+        ValueError: If the message is not valid UTF-8 JSON. The stream is
+            left at the start of the next message.
+    """
+    header = stream.read(LENGTH.size)
+    if len(header) < LENGTH.size:
+        return None
+    length, = LENGTH.unpack(header)
+    body = stream.read(length)
+    if len(body) < length:
+        return None
+    return json.loads(body.decode('utf-8'))
+
+
+def write_message(stream, message):
+    body = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    if len(body) > MAX_MESSAGE_SIZE:
+        raise ValueError(f"Message of {len(body)} bytes is larger than {MAX_MESSAGE_SIZE} bytes.")
+    stream.write(LENGTH.pack(len(body)) + body)
+    stream.flush()
+
+
+def canonical_host(url:str):
+    """Returns the host of a url in lower case and without a leading 'www.'."""
+    host = url_domain(url)
+    return host[4:] if host.startswith('www.') else host
+
+
+def _url_scheme(url:str):
+    """Returns the scheme of a saved url; urls saved without one count as https."""
+    return urlparse(url).scheme.lower() if '://' in url else 'https'
+
+
+def _parent_hosts(host:str):
+    """Yields `host` and its parent domains, down to two labels: a.b.example.com, b.example.com, example.com."""
+    labels = host.split('.')
+    for i in range(max(1, len(labels) - 1)):
+        yield '.'.join(labels[i:])
+
+
+class NativeHost:
+    """
+    Answers native-messaging requests from a vault kept in memory.
+
+    Args:
+        vault_path (Path): The vault file; its size and mtime are checked before every request.
+        load_vault (callable): Returns `(user_data, secret_store)`.
+        get_app_key (callable): Returns the app key of the live session, or None.
+        usage (UsageStats, optional): Used to order the credentials of a host and
+            to decrypt the passwords of the most used websites ahead of time.
+        preload (int, optional): How many of the most used websites to preload.
+    """
+    def __init__(self, vault_path, load_vault, get_app_key, usage=None, preload:int=PRELOAD_COUNT):
+        self.vault_path = vault_path
+        self.load_vault = load_vault
+        self.get_app_key = get_app_key
+        self.usage = usage
+        self.preload = preload
+        self._stamp = None
+        self._app_key = None
+        self._fernet = None
+        self._passwords = {}  # url hash -> decrypted password
+
+    def _refresh_vault(self):
+        stamp = file_stamp(self.vault_path)
+        if stamp is not None and stamp == self._stamp:
+            return
+        self.user_data, self.secrets = self.load_vault()
+        self.websites = self.user_data['websites']
+        self.by_host = {}
+        for url_hash, website_info in self.websites.items():
+            self.by_host.setdefault(canonical_host(website_info['url']), []).append(url_hash)
+        if self.usage is not None:
+            for url_hashes in self.by_host.values():
+                url_hashes[:] = self.usage.rank(url_hashes)
+        self._passwords = {}
+        self._stamp = stamp
+        self._preload()
+
+    def _refresh_session(self):
+        """Returns True if the session is live."""
+        app_key = self.get_app_key()
+        if app_key != self._app_key:
+            self._app_key = app_key
+            self._fernet = Fernet(app_key) if app_key else None
+            self._passwords = {}
+            self._preload()
+        return self._fernet is not None
+
+    def _preload(self):
+        if self._fernet is None or self.usage is None or self._stamp is None:
+            return
+        hottest = [url_hash for url_hash in self.usage.hottest() if url_hash in self.websites]
+        for url_hash in hottest[:self.preload]:
+            self._password(url_hash)
+
+    def _password(self, url_hash:str):
+        if url_hash not in self._passwords:
+            token = self.secrets.get_password(url_hash)
+            try:
+                self._passwords[url_hash] = self._fernet.decrypt(token).decode() if token else None
+            except InvalidToken:
+                self._passwords[url_hash] = None
+        return self._passwords[url_hash]
+
+    def lookup(self, origin:str):
+        """
+        Returns the url hashes saved for `origin` or its closest parent domain, most used first.
+
+        Credentials saved for an https url are never returned to an http
+        origin: the page asking for them was loaded in plaintext.
+        """
+        host = canonical_host(origin)
+        secure_origin = _url_scheme(origin) == 'https'
+        for candidate in _parent_hosts(host):
+            url_hashes = [
+                url_hash for url_hash in self.by_host.get(candidate, [])
+                if secure_origin or _url_scheme(self.websites[url_hash]['url']) != 'https'
+            ]
+            if url_hashes:
+                return url_hashes
+        return []
+
+    def handle(self, request:dict):
+        """Returns the response to one request."""
+        if not isinstance(request, dict):
+            return {'id': None, 'ok': False, 'error': "request must be a JSON object"}
+        response = {'id': request.get('id')}
+        request_type = request.get('type')
+        try:
+            self._refresh_vault()
+            unlocked = self._refresh_session()
+
+            if request_type == 'ping':
+                response.update(ok=True, locked=not unlocked, entries=len(self.websites))
+            elif request_type == 'credentials':
+                origin = request.get('origin') or ''
+                if urlparse(origin).scheme not in ('http', 'https'):
+                    response.update(ok=False, error="origin must be an http(s) url")
+                elif not unlocked:
+                    response.update(ok=False, error="locked")
+                else:
+                    response.update(ok=True, credentials=[
+                        {
+                            'url': self.websites[url_hash]['url'],
+                            'username': self.websites[url_hash].get('username'),
+                            'password': self._password(url_hash),
+                            'keys': self.websites[url_hash]['keys'],
+                        }
+                        for url_hash in self.lookup(origin)
+                    ])
+            else:
+                response.update(ok=False, error=f"unknown request type '{request_type}'")
+        except Exception as e:
+            response.update(ok=False, error=str(e))
+        return response
+
+    def serve(self, stdin, stdout):
+        """
+        Answers requests until the browser closes the connection.
+
+        A malformed request or a response too large to send gets an error
+        response; the host keeps running.
+        """
+        while True:
+            try:
+                request = read_message(stdin)
+            except ValueError as e:
+                # UnicodeDecodeError and JSONDecodeError are both ValueErrors
+                write_message(stdout, {'id': None, 'ok': False, 'error': f"invalid message: {e}"})
+                continue
+            if request is None:
+                return
+            response = self.handle(request)
+            try:
+                write_message(stdout, response)
+            except ValueError as e:
+                write_message(stdout, {'id': response.get('id'), 'ok': False, 'error': str(e)})
+
+
+class StubClient:
+    """
+    Stands in for the browser: starts a host process and talks to it over pipes.
+
+    Args:
+        command (list): The command starting the host.
+    """
+    def __init__(self, command, env=None):
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env)
+        self._next_id = 0
+
+    def send(self, message:dict):
+        """Sends a request without waiting for its response and returns its id."""
+        self._next_id += 1
+        message = dict(message, id=self._next_id)
+        write_message(self.process.stdin, message)
+        return self._next_id
+
+    def receive(self):
+        return read_message(self.process.stdout)
+
+    def request(self, message:dict):
+        self.send(message)
+        return self.receive()
+
+    def pipeline(self, messages):
+        """
+        Send all `messages` without waiting, reading the responses meanwhile.
+
+        Returns:
+            tuple: `(responses, seconds)`
+        """
+        messages = list(messages)
+        # Write from another thread: with both pipes full, writing and then
+        # reading would deadlock
+        writer = threading.Thread(target=lambda: [self.send(message) for message in messages])
+        started = time.perf_counter()
+        writer.start()
+        responses = [self.receive() for _ in messages]
+        writer.join()
+        return responses, time.perf_counter() - started
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
@@ -0,0 +1,111 @@
+# Profiles and the cross-profile key index for WebPassAccess
+# Author: Indrajit Ghosh
+# Created On: Oct 19, 2026
+#
+# Every profile is a separate vault with its own app key and session token
+# (see `profile_app_data_dir` in config.py). The key index maps every site key
+# of every profile to `(profile, url_hash)` so that a key can be resolved
+# across profiles with one dictionary lookup instead of opening each vault.
+#
+# The index keeps one section per profile together with the size and mtime of
+# the vault it was read from. `refresh` only stats the vault files and re-reads
+# the sections of profiles whose vault changed.
+#
+
+# Standard library imports
+import json
+import re
+from pathlib import Path
+
+# Local imports
+from utils.common import atomic_write, file_stamp
+
+PROFILE_NAME = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+
+
+def is_valid_profile_name(name:str):
+    return bool(PROFILE_NAME.match(name))
+
+
+def _read_keys(vault_path:Path):
+    """Returns `{site key: url hash}` for a vault file."""
+    with open(vault_path, 'r') as f:
+        websites = json.load(f).get('websites', {})
+    return {
+        key: url_hash
+        for url_hash, website_info in websites.items()
+        for key in website_info['keys']
+    }
+
+
+class ProfileKeyIndex:
+    """
+    Merged index of the site keys of several profiles.
+
+    Args:
+        filepath (Path): Where the index is kept. It is created on the first `save()`.
+    """
+    def __init__(self, filepath):
+        self.filepath = Path(filepath)
+        self.sections = {}  # profile -> {'stamp': [mtime_ns, size], 'keys': {key: url_hash}}
+        self._merged = None
+        self._dirty = False
+        if self.filepath.exists():
+            with open(self.filepath, 'r') as f:
+                self.sections = json.load(f)['profiles']
+
+    def refresh(self, vaults:dict):
+        """
+        Bring the index up to date with the given profiles.
+
+        Sections of profiles whose vault changed since they were read are
+        rebuilt, and sections of profiles not in `vaults` are dropped.
+
+        Args:
+            vaults (dict): `{profile: path to its websites_data.json}`.
+
+        Returns:
+            list: The profiles whose section was rebuilt.
+        """
+        rebuilt = []
+        for profile in list(self.sections):
+            if profile not in vaults:
+                del self.sections[profile]
+                self._dirty = True
+
+        for profile, vault_path in vaults.items():
+            stamp = file_stamp(vault_path)
+            section = self.sections.get(profile)
+            if section is not None and section['stamp'] == stamp:
+                continue
+            if stamp is None:
+                self.sections.pop(profile, None)
+            else:
+                self.sections[profile] = {'stamp': stamp, 'keys': _read_keys(vault_path)}
+                rebuilt.append(profile)
+            self._dirty = True
+
+        if self._dirty:
+            self._merged = None
+        return rebuilt
+
+    def _merge(self):
+        merged = {}
+        for profile in sorted(self.sections):
+            for key, url_hash in self.sections[profile]['keys'].items():
+                merged.setdefault(key, []).append((profile, url_hash))
+        return merged
+
+    def lookup(self, site_key:str):
+        """Returns the `(profile, url_hash)` pairs of `site_key`, ordered by profile name."""
+        if self._merged is None:
+            self._merged = self._merge()
+        return self._merged.get(site_key, [])
+
+    def save(self):
+        """Writes the index if it changed since it was loaded."""
+        if not self._dirty:
+            return
+        with atomic_write(self.filepath) as f:
+            json.dump({'profiles': self.sections}, f)
+        self._dirty = False
@@ -0,0 +1,184 @@
+# Cold storage for encrypted site passwords
+# Author: Indrajit Ghosh
+# Created On: Oct 19, 2026
+#
+# `websites_data.json` only holds the metadata of every website (url, keys,
+# username); the encrypted passwords live here, split into small bucket files
+# by the first two hex characters of the url hash. Listing and searching never
+# open this store and `visit` reads a single bucket.
+#
+# Record layout (per url hash):
+#   {
+#       "password": "<fernet token>",
+#       "history": [{"password": "<fernet token>", "replaced_on": <epoch>}, ...]
+#   }
+# `history` is a ring buffer of the previous passwords, newest first.
+#
+# A whole new store (a restore, the migration that created the store) is
+# written by a SecretStoreWriter into a sibling `.new` directory, one record
+# at a time, and swapped in at the end.
+#
+
+# Standard library imports
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+# Local imports
+from utils.common import atomic_write
+
+SECRETS_DIR_NAME = 'secrets'
+PASSWORD_HISTORY_SIZE = 5
+PREFIX_LENGTH = 2
+FLUSH_RECORDS = 4096  # Records a SecretStoreWriter buffers before writing them out
+
+
+class SecretStore:
+    """
+    Bucketed store of encrypted passwords, keyed by url hash.
+
+    Buckets are loaded on first use and written back by `save()`.
+
+    Args:
+        secrets_dir (Path): The directory holding the bucket files.
+        history_size (int, optional): How many previous passwords to keep per entry.
+    """
+    def __init__(self, secrets_dir, history_size:int=PASSWORD_HISTORY_SIZE):
+        self.secrets_dir = Path(secrets_dir)
+        self.history_size = history_size
+        self._buckets = {}
+        self._dirty = set()
+
+    @classmethod
+    def for_vault(cls, vault_path, **kwargs):
+        """Returns the store that belongs to the vault file `vault_path`."""
+        return cls(Path(vault_path).parent / SECRETS_DIR_NAME, **kwargs)
+
+    def _bucket(self, url_hash:str):
+        prefix = url_hash[:PREFIX_LENGTH]
+        if prefix not in self._buckets:
+            path = self.secrets_dir / f"{prefix}.json"
+            if path.exists():
+                with open(path, 'r') as f:
+                    self._buckets[prefix] = json.load(f)
+            else:
+                self._buckets[prefix] = {}
+        return self._buckets[prefix]
+
+    def get(self, url_hash:str):
+        """Returns the secret record of `url_hash`, or None."""
+        return self._bucket(url_hash).get(url_hash)
+
+    def get_password(self, url_hash:str):
+        """Returns the encrypted password of `url_hash`, or None."""
+        record = self.get(url_hash)
+        return record.get('password') if record else None
+
+    def set_password(self, url_hash:str, encrypted_password:str):
+        """Sets the encrypted password of `url_hash`, moving the old one into its history."""
+        bucket = self._bucket(url_hash)
+        record = bucket.setdefault(url_hash, {'password': None, 'history': []})
+        if record['password'] and record['password'] != encrypted_password:
+            record['history'].insert(0, {'password': record['password'], 'replaced_on': time.time()})
+            del record['history'][self.history_size:]
+        record['password'] = encrypted_password
+        self._dirty.add(url_hash[:PREFIX_LENGTH])
+
+    def put(self, url_hash:str, record:dict):
+        """Stores a whole secret record as is."""
+        self._bucket(url_hash)[url_hash] = record
+        self._dirty.add(url_hash[:PREFIX_LENGTH])
+
+    def delete(self, url_hash:str):
+        if self._bucket(url_hash).pop(url_hash, None) is not None:
+            self._dirty.add(url_hash[:PREFIX_LENGTH])
+
+    def items(self):
+        """Yields `(url_hash, record)` for every stored secret. Reads every bucket."""
+        if not self.secrets_dir.exists():
+            return
+        for path in sorted(self.secrets_dir.glob('*.json')):
+            yield from self._bucket(path.stem).items()
+
+    def save(self):
+        """Writes back the buckets changed since they were loaded."""
+        self.secrets_dir.mkdir(parents=True, exist_ok=True)
+        for prefix in self._dirty:
+            with atomic_write(self.secrets_dir / f"{prefix}.json") as f:
+                json.dump(self._buckets[prefix], f)
+        self._dirty.clear()
+
+    def writer(self):
+        """Returns a SecretStoreWriter that replaces this store when committed."""
+        return SecretStoreWriter(self.secrets_dir)
+
+    def replace_all(self, records:dict):
+        """
+        Replace the whole store with `records` (url hash -> record).
+
+        The new buckets are written next to the store and swapped in at the
+        end, so the old store stays intact if this is interrupted.
+        """
+        writer = self.writer()
+        for url_hash, record in records.items():
+            writer.add(url_hash, record)
+        writer.commit()
+
+        self._buckets = {}
+        self._dirty.clear()
+
+
+class SecretStoreWriter:
+    """
+    Writes a whole new secret store, one record at a time.
+
+    Records are buffered per bucket and appended to the bucket files of a
+    sibling `.new` directory in batches, so memory use does not depend on the
+    size of the store and at most one file is open at a time. `commit()` swaps
+    the new store in; until then the old one stays intact.
+
+    Args:
+        secrets_dir (Path): The directory of the store to replace.
+        flush_records (int, optional): How many records to buffer.
+    """
+    def __init__(self, secrets_dir, flush_records:int=FLUSH_RECORDS):
+        self.secrets_dir = Path(secrets_dir)
+        self.new_dir = self.secrets_dir.with_name(self.secrets_dir.name + '.new')
+        self.flush_records = flush_records
+        self._pending = {}
+        self._pending_count = 0
+        self._opened = set()
+
+        shutil.rmtree(self.new_dir, ignore_errors=True)
+        self.new_dir.mkdir(parents=True)
+
+    def add(self, url_hash:str, record:dict):
+        self._pending.setdefault(url_hash[:PREFIX_LENGTH], []).append((url_hash, record))
+        self._pending_count += 1
+        if self._pending_count >= self.flush_records:
+            self._flush()
+
+    def _flush(self):
+        for prefix, items in self._pending.items():
+            with open(self.new_dir / f"{prefix}.json", 'a') as f:
+                for url_hash, record in items:
+                    f.write((',' if prefix in self._opened else '{') + json.dumps(url_hash) + ':' + json.dumps(record))
+                    self._opened.add(prefix)
+        self._pending = {}
+        self._pending_count = 0
+
+    def commit(self):
+        """Completes the bucket files and swaps the new store in."""
+        self._flush()
+        for prefix in self._opened:
+            with open(self.new_dir / f"{prefix}.json", 'a') as f:
+                f.write('}')
+
+        old_dir = self.secrets_dir.with_name(self.secrets_dir.name + '.old')
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if self.secrets_dir.exists():
+            os.replace(self.secrets_dir, old_dir)
+        os.replace(self.new_dir, self.secrets_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
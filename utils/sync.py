@@ -0,0 +1,526 @@
+# Two-way vault sync for WebPassAccess
+# Author: Indrajit Ghosh
+# Created On: Oct 19, 2026
+#
+# Every entry (and every deletion tombstone) carries a `version` and a
+# `modified` timestamp. Each vault builds a Merkle tree over its entries
+# bucketed by the hex prefix of their url hash; comparing two trees only
+# descends into subtrees whose hashes differ, so finding the differing
+# entries costs O(changes * log N) rather than a comparison of every entry.
+#
+# Each vault keeps a small `sync_state.json` next to it (see SyncState) with a
+# random vault id and, per peer, the version every entry had when the two
+# vaults were last synced: the base.
+#
+# Merge rules, applied per differing entry:
+#   1. An entry present on one side only is copied to the other.
+#   2. If only one side changed the entry since the base, that side wins.
+#   3. If both sides changed it (concurrent edits), the later `modified` wins
+#      and the entry is reported as a conflict. If that ties too, the larger
+#      canonical JSON wins so that both machines always agree on the result.
+# Without a base (the first sync of two vaults) an edit is only recognised as
+# concurrent when both versions are equal; otherwise the higher version wins.
+# Passwords are not part of the tree, and entries upgraded from an old vault
+# all have version 0, so copies that differ only in a password look equal.
+# Entries that are equal on both sides but missing from the base (or all of
+# them on a first sync) therefore have their decrypted passwords compared too;
+# a mismatch is a conflict, won by the password changed last.
+# When a conflict replaces a different password, that password is kept in the
+# history of the record that wins, so no password is ever lost.
+# Tombstones take part in the rules like any other entry. The secret record
+# of an entry (see utils.secret_store) travels with the winning entry, and so
+# do its attachment files: `transfer_attachments` copies (or re-encrypts) the
+# files the receiving vault lacks and `remove_dropped_attachments` deletes the
+# ones the overwritten entry or tombstone no longer refers to.
+#
+# `supersede` prepares a vault whose entries were replaced wholesale (by
+# `restore`) so that its state wins on the next sync instead of being undone.
+#
+
+# Standard library imports
+import copy
+import hashlib
+import json
+import time
+import uuid
+from pathlib import Path
+
+# Third-party imports
+from cryptography.fernet import Fernet
+
+# Local imports
+from utils.attachments import AttachmentError, copy_attachment, remove_attachment
+from utils.common import atomic_write, canonical_json
+
+MERKLE_DEPTH = 4
+HEX_DIGITS = '0123456789abcdef'
+SYNC_STATE_FILE_NAME = 'sync_state.json'
+
+
+def entry_digest(entry:dict, deleted:bool=False):
+    """
+    Returns a digest of an entry.
+
+    Secrets are not part of it: the same password encrypted under two app keys
+    gives two different tokens, and a password change always bumps `version`
+    and `modified` anyway. For the same reason the digests of attachments are
+    left out: an attachment copied to a vault with another app key is
+    re-encrypted, which changes its digest.
+    """
+    if entry.get('attachments'):
+        entry = dict(entry, attachments=[
+            {k: v for k, v in reference.items() if k != 'digest'}
+            for reference in entry['attachments']
+        ])
+    return hashlib.sha256(canonical_json({'entry': entry, 'deleted': deleted})).hexdigest()
+
+
+class MerkleTree:
+    """
+    Merkle tree over the url hashes of a vault.
+
+    Leaves are buckets of entries sharing the first `depth` hex characters of
+    their url hash; every inner node hashes its (up to 16) children.
+
+    Args:
+        leaves (dict): Mapping of url hash to entry digest.
+        depth (int, optional): Depth of the tree. Defaults to MERKLE_DEPTH.
+    """
+    def __init__(self, leaves:dict, depth:int=MERKLE_DEPTH):
+        self.depth = depth
+        self.leaves = leaves
+        self.buckets = {}
+        for url_hash in leaves:
+            self.buckets.setdefault(url_hash[:depth], []).append(url_hash)
+
+        level = {}
+        for prefix, url_hashes in self.buckets.items():
+            hasher = hashlib.sha256()
+            for url_hash in sorted(url_hashes):
+                hasher.update(f"{url_hash}:{leaves[url_hash]};".encode())
+            level[prefix] = hasher.hexdigest()
+
+        self.nodes = dict(level)
+        for d in range(depth - 1, -1, -1):
+            children = {}
+            for prefix in level:
+                children.setdefault(prefix[:d], []).append(prefix)
+            level = {
+                parent: hashlib.sha256(
+                    ''.join(f"{c}:{level[c]};" for c in sorted(kids)).encode()
+                ).hexdigest()
+                for parent, kids in children.items()
+            }
+            self.nodes.update(level)
+
+    @classmethod
+    def from_user_data(cls, user_data:dict, depth:int=MERKLE_DEPTH):
+        leaves = {
+            url_hash: entry_digest(entry)
+            for url_hash, entry in user_data.get('websites', {}).items()
+        }
+        leaves.update(
+            (url_hash, entry_digest(tombstone, deleted=True))
+            for url_hash, tombstone in user_data.get('deleted', {}).items()
+        )
+        return cls(leaves, depth=depth)
+
+    @property
+    def root(self):
+        return self.nodes.get('')
+
+    def diff(self, other:'MerkleTree'):
+        """Returns the sorted url hashes whose entries differ between the two trees."""
+        if self.depth != other.depth:
+            raise ValueError("Cannot compare Merkle trees of different depths.")
+
+        differing = []
+        stack = ['']
+        while stack:
+            prefix = stack.pop()
+            if self.nodes.get(prefix) == other.nodes.get(prefix):
+                continue
+            if len(prefix) == self.depth:
+                candidates = set(self.buckets.get(prefix, [])) | set(other.buckets.get(prefix, []))
+                differing.extend(
+                    url_hash for url_hash in candidates
+                    if self.leaves.get(url_hash) != other.leaves.get(url_hash)
+                )
+            else:
+                stack.extend(prefix + c for c in HEX_DIGITS)
+
+        return sorted(differing)
+
+
+def _lookup(user_data:dict, url_hash:str):
+    """Returns `(entry, deleted)` for `url_hash`, or `(None, False)` if unknown."""
+    if url_hash in user_data.get('websites', {}):
+        return user_data['websites'][url_hash], False
+    if url_hash in user_data.get('deleted', {}):
+        return user_data['deleted'][url_hash], True
+    return None, False
+
+
+def _store(user_data:dict, url_hash:str, entry:dict, deleted:bool):
+    user_data.setdefault('deleted', {})
+    if deleted:
+        user_data['websites'].pop(url_hash, None)
+        user_data['deleted'][url_hash] = entry
+    else:
+        user_data['deleted'].pop(url_hash, None)
+        user_data['websites'][url_hash] = entry
+
+
+def _reencrypt(record:dict, from_fernet:Fernet, to_fernet:Fernet):
+    """Re-encrypts the password and password history of a secret record."""
+    def translate(token):
+        return to_fernet.encrypt(from_fernet.decrypt(token)).decode() if token else token
+
+    return {
+        'password': translate(record.get('password')),
+        'history': [
+            dict(old, password=translate(old['password']))
+            for old in record.get('history', [])
+        ],
+    }
+
+
+def _decrypt_password(record, fernet:Fernet):
+    token = (record or {}).get('password')
+    return fernet.decrypt(token) if token else None
+
+
+def _password_changed_on(record):
+    """When the current password of a record was set, as far as its history tells (0 if unknown)."""
+    history = (record or {}).get('history') or []
+    return history[0].get('replaced_on', 0) if history else 0
+
+
+def _keep_replaced_password(url_hash:str, win_store, win_fernet:Fernet, lose_store, lose_fernet:Fernet):
+    """Adds the current password of the losing side to the history of the winning record, unless it is already there."""
+    lost = _decrypt_password(lose_store.get(url_hash), lose_fernet)
+    record = win_store.get(url_hash)
+    if lost is None or lost == _decrypt_password(record, win_fernet):
+        return
+    if any(lost == _decrypt_password(old, win_fernet) for old in (record or {}).get('history', [])):
+        return
+    record = dict(record or {'password': None, 'history': []})
+    old = {'password': win_fernet.encrypt(lost).decode(), 'replaced_on': time.time()}
+    record['history'] = ([old] + record.get('history', []))[:win_store.history_size]
+    win_store.put(url_hash, record)
+
+
+def _differing_passwords(url_hashes, local_secrets, remote_secrets, local_fernet:Fernet, remote_fernet:Fernet):
+    """
+    Pick out the entries whose passwords differ between the two vaults.
+
+    Returns:
+        dict: `{url_hash: 'local' | 'remote'}`, the side whose password was
+              changed last (ties go to the larger digest of the password, so
+              both machines agree).
+    """
+    differing = {}
+    for url_hash in url_hashes:
+        local_record = local_secrets.get(url_hash)
+        remote_record = remote_secrets.get(url_hash)
+        local_token = (local_record or {}).get('password')
+        remote_token = (remote_record or {}).get('password')
+        if local_token == remote_token:
+            continue
+        local_password = _decrypt_password(local_record, local_fernet)
+        remote_password = _decrypt_password(remote_record, remote_fernet)
+        if local_password == remote_password:
+            continue
+        local_key = (_password_changed_on(local_record), hashlib.sha256(local_password or b'').digest())
+        remote_key = (_password_changed_on(remote_record), hashlib.sha256(remote_password or b'').digest())
+        differing[url_hash] = 'local' if local_key >= remote_key else 'remote'
+    return differing
+
+
+def _copy_secret(url_hash:str, from_store, to_store, deleted:bool, translate):
+    record = None if deleted else from_store.get(url_hash)
+    if record is None:
+        to_store.delete(url_hash)
+    else:
+        to_store.put(url_hash, translate(record))
+
+
+def _resolve(local, local_deleted, remote, remote_deleted, base_version=None):
+    """
+    Pick the winning side for an entry present in both vaults.
+
+    Args:
+        base_version (int, optional): The version both sides had at their last
+            sync, or None if they have never been synced.
+
+    Returns:
+        tuple: `('local' | 'remote', conflict)`
+    """
+    local_version = local.get('version', 0)
+    remote_version = remote.get('version', 0)
+    if base_version is not None:
+        local_moved = local_version > base_version
+        remote_moved = remote_version > base_version
+        if local_moved != remote_moved:
+            return ('local' if local_moved else 'remote'), False
+    elif local_version != remote_version:
+        return ('local' if local_version > remote_version else 'remote'), False
+
+    local_key = (local.get('modified', 0), local_deleted, canonical_json(local))
+    remote_key = (remote.get('modified', 0), remote_deleted, canonical_json(remote))
+    return ('local' if local_key >= remote_key else 'remote'), True
+
+
+def entry_versions(user_data:dict):
+    """Returns `{url_hash: version}` for every entry and tombstone."""
+    versions = {
+        url_hash: entry.get('version', 0)
+        for url_hash, entry in user_data.get('websites', {}).items()
+    }
+    versions.update(
+        (url_hash, tombstone.get('version', 0))
+        for url_hash, tombstone in user_data.get('deleted', {}).items()
+    )
+    return versions
+
+
+class SyncState:
+    """
+    The id of a vault and its sync bases, kept in `sync_state.json` next to the vault.
+
+    Args:
+        filepath (Path): The state file. It is created on the first `save()`.
+    """
+    def __init__(self, filepath):
+        self.filepath = Path(filepath)
+        if self.filepath.exists():
+            with open(self.filepath, 'r') as f:
+                self._state = json.load(f)
+        else:
+            self._state = {'vault_id': uuid.uuid4().hex, 'peers': {}}
+
+    @classmethod
+    def for_vault(cls, vault_path):
+        return cls(Path(vault_path).parent / SYNC_STATE_FILE_NAME)
+
+    @property
+    def vault_id(self):
+        return self._state['vault_id']
+
+    def new_vault_id(self):
+        """Gives the vault a new id, e.g. when it turns out to be a copy of its peer."""
+        self._state['vault_id'] = uuid.uuid4().hex
+        self._state['peers'] = {}
+
+    def base(self, peer_id:str):
+        """Returns `{url_hash: version}` as of the last sync with `peer_id`, or None."""
+        peer = self._state['peers'].get(peer_id)
+        return peer['versions'] if peer else None
+
+    def record(self, peer_id:str, versions:dict):
+        self._state['peers'][peer_id] = {'synced_at': time.time(), 'versions': versions}
+
+    def save(self):
+        with atomic_write(self.filepath) as f:
+            json.dump(self._state, f)
+
+
+def supersede(new_data:dict, current_data:dict, now:float=None):
+    """
+    Make `new_data` win over `current_data` on later syncs.
+
+    `new_data` (e.g. a restored snapshot) is about to replace `current_data`.
+    Every entry or tombstone of `new_data` that differs from the current one
+    gets a version above both and a fresh `modified`; entries that only exist
+    in `current_data` are turned into tombstones the same way. Otherwise the
+    next sync would see the other vault's newer versions and undo the change.
+
+    Returns:
+        list: The url hashes whose version was bumped.
+    """
+    now = now or time.time()
+    new_data.setdefault('deleted', {})
+
+    bumped = []
+    url_hashes = set(entry_versions(new_data)) | set(entry_versions(current_data))
+    for url_hash in sorted(url_hashes):
+        current, current_deleted = _lookup(current_data, url_hash)
+        if current is None:
+            continue
+        new, new_deleted = _lookup(new_data, url_hash)
+        if new is None:
+            if current_deleted:
+                # Created and deleted since: keep the deletion as it is
+                _store(new_data, url_hash, dict(current), deleted=True)
+                continue
+            new, new_deleted = {'url': current['url']}, True
+        elif new_deleted == current_deleted and new == current:
+            continue
+        else:
+            new = dict(new)
+
+        new['version'] = max(new.get('version', 0), current.get('version', 0)) + 1
+        new['modified'] = now
+        _store(new_data, url_hash, new, new_deleted)
+        bumped.append(url_hash)
+
+    return bumped
+
+
+def sync_vaults(local_data:dict, remote_data:dict, local_secrets, remote_secrets, local_key, remote_key, base:dict=None):
+    """
+    Merge two vaults in place so that both end up with the same entries.
+
+    Passwords copied from one vault to the other are re-encrypted with the
+    app key of the receiving vault. Entries not yet compared at an earlier
+    sync also have their passwords compared (see `_differing_passwords`).
+    The caller saves both vaults and both secret stores.
+
+    Args:
+        local_data (dict): User data of this vault.
+        remote_data (dict): User data of the other vault.
+        local_secrets (SecretStore): Secret store of this vault.
+        remote_secrets (SecretStore): Secret store of the other vault.
+        local_key (str): Decrypted app key of this vault.
+        remote_key (str): Decrypted app key of the other vault.
+        base (dict, optional): `{url_hash: version}` as of the last sync of the
+            two vaults (see SyncState), or None if they were never synced.
+
+    Returns:
+        list: One dict per differing entry with the keys `url_hash`, `url`,
+              `action` ('pulled' or 'pushed'), `deleted`, `conflict`,
+              `copy_attachments` (references whose files the receiving vault
+              lacks) and `drop_attachments` (ids of the files it no longer needs).
+    """
+    local_tree = MerkleTree.from_user_data(local_data)
+    remote_tree = MerkleTree.from_user_data(remote_data)
+
+    local_fernet = Fernet(local_key)
+    remote_fernet = Fernet(remote_key)
+    if local_key == remote_key:
+        pull = push = dict
+    else:
+        pull = lambda record: _reencrypt(record, remote_fernet, local_fernet)
+        push = lambda record: _reencrypt(record, local_fernet, remote_fernet)
+
+    differing = set(local_tree.diff(remote_tree))
+
+    # Equal entries can still hide different passwords when they were never
+    # compared at a sync before
+    unchecked = [
+        url_hash for url_hash in set(local_data['websites']) & set(remote_data['websites'])
+        if (base is None or url_hash not in base) and url_hash not in differing
+    ]
+    password_winners = _differing_passwords(sorted(unchecked), local_secrets, remote_secrets, local_fernet, remote_fernet)
+
+    report = []
+    for url_hash in sorted(differing | set(password_winners)):
+        local, local_deleted = _lookup(local_data, url_hash)
+        remote, remote_deleted = _lookup(remote_data, url_hash)
+
+        if url_hash in password_winners:
+            winner, conflict = password_winners[url_hash], True
+        elif local is None:
+            winner, conflict = 'remote', False
+        elif remote is None:
+            winner, conflict = 'local', False
+        else:
+            # An entry missing from the base appeared on both sides since the last sync
+            base_version = None if base is None else base.get(url_hash, 0)
+            winner, conflict = _resolve(local, local_deleted, remote, remote_deleted, base_version)
+
+        if winner == 'remote':
+            received, received_deleted, replaced, replaced_deleted = remote, remote_deleted, local, local_deleted
+            if conflict and not (local_deleted or remote_deleted):
+                _keep_replaced_password(url_hash, remote_secrets, remote_fernet, local_secrets, local_fernet)
+            _store(local_data, url_hash, copy.deepcopy(remote), remote_deleted)
+            _copy_secret(
+                url_hash, remote_secrets, local_secrets, remote_deleted,
+                translate=pull
+            )
+            deleted = remote_deleted
+        else:
+            received, received_deleted, replaced, replaced_deleted = local, local_deleted, remote, remote_deleted
+            if conflict and not (local_deleted or remote_deleted):
+                _keep_replaced_password(url_hash, local_secrets, local_fernet, remote_secrets, remote_fernet)
+            _store(remote_data, url_hash, copy.deepcopy(local), local_deleted)
+            _copy_secret(
+                url_hash, local_secrets, remote_secrets, local_deleted,
+                translate=push
+            )
+            deleted = local_deleted
+
+        received_attachments = [] if received_deleted else received.get('attachments', [])
+        replaced_ids = {
+            reference['id'] for reference in
+            ([] if replaced is None or replaced_deleted else replaced.get('attachments', []))
+        }
+        report.append({
+            'url_hash': url_hash,
+            'url': (local or {}).get('url') or (remote or {}).get('url') or url_hash,
+            'action': 'pulled' if winner == 'remote' else 'pushed',
+            'deleted': deleted,
+            'conflict': conflict,
+            'copy_attachments': [a for a in received_attachments if a['id'] not in replaced_ids],
+            'drop_attachments': sorted(replaced_ids - {a['id'] for a in received_attachments}),
+        })
+
+    return report
+
+
+def _receiving_side(change:dict, local, remote):
+    """Returns `(from, to)` out of the local and remote values for a change of `sync_vaults`."""
+    return (remote, local) if change['action'] == 'pulled' else (local, remote)
+
+
+def _drop_reference(entry:dict, attachment_id:str):
+    references = [a for a in entry.get('attachments', []) if a['id'] != attachment_id]
+    if references:
+        entry['attachments'] = references
+    else:
+        entry.pop('attachments', None)
+
+
+def transfer_attachments(report, local_data:dict, remote_data:dict, local_dir, remote_dir, local_key, remote_key):
+    """
+    Copy the attachment files of the merged entries to the vault that received them.
+
+    Files are re-encrypted for a vault with another app key and the receiving
+    entry gets the new digest. An attachment that cannot be copied (its file
+    is missing or fails authentication) is dropped from the entry in both
+    vaults, which keeps them in sync; the broken file stays behind for
+    `verify-attachments` to report. Run it after `sync_vaults` and before
+    saving the vaults, so no saved entry refers to a file that is not there.
+
+    Returns:
+        list: `(url, name, error)` for every attachment that was dropped.
+    """
+    failed = []
+    for change in report:
+        if not change['copy_attachments']:
+            continue
+        from_dir, to_dir = _receiving_side(change, local_dir, remote_dir)
+        from_key, to_key = _receiving_side(change, local_key, remote_key)
+        from_data, to_data = _receiving_side(change, local_data, remote_data)
+        from_entry = from_data['websites'][change['url_hash']]
+        to_entry = to_data['websites'][change['url_hash']]
+        references = {a['id']: a for a in to_entry['attachments']}
+
+        for reference in change['copy_attachments']:
+            try:
+                copied = copy_attachment(reference, from_dir, to_dir, from_key, to_key)
+            except AttachmentError as e:
+                failed.append((change['url'], reference['name'], str(e)))
+                _drop_reference(from_entry, reference['id'])
+                _drop_reference(to_entry, reference['id'])
+                continue
+            references[reference['id']].update(copied)
+    return failed
+
+
+def remove_dropped_attachments(report, local_dir, remote_dir):
+    """Delete the attachment files the merged entries no longer refer to. Run it after saving the vaults."""
+    for change in report:
+        _, to_dir = _receiving_side(change, local_dir, remote_dir)
+        for attachment_id in change['drop_attachments']:
+            remove_attachment(to_dir, attachment_id)
@@ -0,0 +1,253 @@
+# Tag bitmap index for WebPassAccess
+# Author: Indrajit Ghosh
+# Created On: Oct 19, 2026
+#
+# Every website entry gets a fixed ordinal, and every tag maps to a bitmap of
+# the ordinals of the entries carrying it (a Python int used as a bit set).
+# A tag expression like `work & !social` is then evaluated with a handful of
+# bitwise operations, whatever the size of the vault.
+#
+# Besides the user's tags, every entry carries the attribute tags
+# `has:username` and `has:password`.
+#
+# On disk the bitmaps are zlib compressed. The index records the size and
+# mtime of the vault it was built from; commands that change single entries
+# update it in place, anything else makes it stale and it is rebuilt on the
+# next query. Removing an entry leaves a hole at its ordinal; once holes are
+# more than half of the ordinals the index is compacted, so add/delete churn
+# cannot grow the bitmaps without limit.
+#
+
+# Standard library imports
+import base64
+import json
+import re
+import zlib
+from pathlib import Path
+
+# Local imports
+from utils.common import atomic_write
+
+_TOKEN = re.compile(r'\s*(\(|\)|&|\||!|[^\s()&|!]+)')
+_OPERATOR_WORDS = {'and': '&', 'or': '|', 'not': '!'}
+
+
+def normalize_tag(tag:str):
+    return tag.strip().lower()
+
+
+def entry_tags(entry:dict):
+    """Returns the user tags and attribute tags of an entry."""
+    tags = {normalize_tag(tag) for tag in entry.get('tags', [])}
+    if entry.get('username'):
+        tags.add('has:username')
+    if entry.get('has_password'):
+        tags.add('has:password')
+    return tags
+
+
+def _bitmap_from_ordinals(ordinals):
+    if not ordinals:
+        return 0
+    bits = bytearray(max(ordinals) // 8 + 1)
+    for ordinal in ordinals:
+        bits[ordinal >> 3] |= 1 << (ordinal & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def _iter_ordinals(bitmap:int):
+    """Yields the ordinals set in `bitmap`, in ascending order."""
+    bits = bin(bitmap)[:1:-1]  # Least significant bit first
+    ordinal = bits.find('1')
+    while ordinal != -1:
+        yield ordinal
+        ordinal = bits.find('1', ordinal + 1)
+
+
+def _encode_bitmap(bitmap:int):
+    raw = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+    return base64.b64encode(zlib.compress(raw)).decode()
+
+
+def _decode_bitmap(encoded:str):
+    return int.from_bytes(zlib.decompress(base64.b64decode(encoded)), 'little')
+
+
+class TagIndex:
+    """
+    Bitmap index from tags to website entries.
+
+    Use `TagIndex.build(user_data)` or `TagIndex.load(path)` to get one.
+    """
+    def __init__(self):
+        self.ordinals = []   # ordinal -> url hash (None for a removed entry)
+        self.positions = {}  # url hash -> ordinal
+        self.bitmaps = {}    # tag -> bitmap
+        self.all = 0         # bitmap of all live entries
+        self.vault_stamp = None
+
+    @classmethod
+    def build(cls, user_data:dict):
+        index = cls()
+        ordinals_per_tag = {}
+        for ordinal, (url_hash, entry) in enumerate(user_data.get('websites', {}).items()):
+            index.ordinals.append(url_hash)
+            index.positions[url_hash] = ordinal
+            for tag in entry_tags(entry):
+                ordinals_per_tag.setdefault(tag, []).append(ordinal)
+
+        index.bitmaps = {
+            tag: _bitmap_from_ordinals(ordinals)
+            for tag, ordinals in ordinals_per_tag.items()
+        }
+        index.all = (1 << len(index.ordinals)) - 1
+        return index
+
+    @classmethod
+    def load(cls, path):
+        """Returns the index saved at `path`, or None if there is none."""
+        path = Path(path)
+        if not path.exists():
+            return None
+        with open(path, 'r') as f:
+            data = json.load(f)
+
+        index = cls()
+        index.ordinals = data['ordinals']
+        index.positions = {
+            url_hash: ordinal
+            for ordinal, url_hash in enumerate(index.ordinals)
+            if url_hash is not None
+        }
+        index.bitmaps = {tag: _decode_bitmap(bitmap) for tag, bitmap in data['bitmaps'].items()}
+        index.all = _decode_bitmap(data['all'])
+        index.vault_stamp = data['vault_stamp']
+        return index
+
+    def save(self, path, vault_stamp):
+        """Saves the index, recording the stamp of the vault it matches."""
+        self.vault_stamp = list(vault_stamp)
+        data = {
+            'vault_stamp': self.vault_stamp,
+            'ordinals': self.ordinals,
+            'all': _encode_bitmap(self.all),
+            'bitmaps': {tag: _encode_bitmap(bitmap) for tag, bitmap in self.bitmaps.items()},
+        }
+        with atomic_write(path) as f:
+            json.dump(data, f)
+
+    def remove_entry(self, url_hash:str):
+        ordinal = self.positions.pop(url_hash, None)
+        if ordinal is None:
+            return
+        mask = ~(1 << ordinal)
+        for tag in list(self.bitmaps):
+            self.bitmaps[tag] &= mask
+            if not self.bitmaps[tag]:
+                del self.bitmaps[tag]
+        self.all &= mask
+        self.ordinals[ordinal] = None
+        if 2 * (len(self.ordinals) - len(self.positions)) > len(self.ordinals):
+            self.compact()
+
+    def compact(self):
+        """Renumbers the live entries so that no ordinal is left unused."""
+        renumbered = {}
+        for ordinal, url_hash in enumerate(self.ordinals):
+            if url_hash is not None:
+                renumbered[ordinal] = len(renumbered)
+        self.ordinals = [url_hash for url_hash in self.ordinals if url_hash is not None]
+        self.positions = {url_hash: ordinal for ordinal, url_hash in enumerate(self.ordinals)}
+        self.bitmaps = {
+            tag: _bitmap_from_ordinals([renumbered[ordinal] for ordinal in _iter_ordinals(bitmap)])
+            for tag, bitmap in self.bitmaps.items()
+        }
+        self.all = (1 << len(self.ordinals)) - 1
+
+    def set_entry(self, url_hash:str, entry:dict):
+        """Adds an entry, or re-indexes it if it is already in the index."""
+        ordinal = self.positions.get(url_hash)
+        if ordinal is None:
+            ordinal = len(self.ordinals)
+            self.ordinals.append(url_hash)
+            self.positions[url_hash] = ordinal
+        bit = 1 << ordinal
+        tags = entry_tags(entry)
+        for tag in set(self.bitmaps) | tags:
+            bitmap = self.bitmaps.get(tag, 0)
+            bitmap = (bitmap | bit) if tag in tags else (bitmap & ~bit)
+            if bitmap:
+                self.bitmaps[tag] = bitmap
+            else:
+                self.bitmaps.pop(tag, None)
+        self.all |= bit
+
+    def tags(self):
+        """Returns `{tag: number of entries}` for every tag in use."""
+        return {tag: bin(bitmap).count('1') for tag, bitmap in sorted(self.bitmaps.items())}
+
+    def query(self, expression:str):
+        """
+        Evaluate a tag expression to a bitmap.
+
+        Tags are combined with `&` (`and`), `|` (`or`), `!` (`not`) and
+        parentheses; `!` binds tightest, then `&`, then `|`.
+
+        Raises:
+            ValueError: If the expression is malformed.
+        """
+        tokens = _tokenize(expression)
+        bitmap, pos = self._parse_or(tokens, 0)
+        if pos != len(tokens):
+            raise ValueError(f"Unexpected '{tokens[pos]}' in tag expression.")
+        return bitmap
+
+    def _parse_or(self, tokens, pos):
+        bitmap, pos = self._parse_and(tokens, pos)
+        while pos < len(tokens) and tokens[pos] == '|':
+            other, pos = self._parse_and(tokens, pos + 1)
+            bitmap |= other
+        return bitmap, pos
+
+    def _parse_and(self, tokens, pos):
+        bitmap, pos = self._parse_not(tokens, pos)
+        while pos < len(tokens) and tokens[pos] == '&':
+            other, pos = self._parse_not(tokens, pos + 1)
+            bitmap &= other
+        return bitmap, pos
+
+    def _parse_not(self, tokens, pos):
+        if pos >= len(tokens):
+            raise ValueError("Incomplete tag expression.")
+        token = tokens[pos]
+        if token == '!':
+            bitmap, pos = self._parse_not(tokens, pos + 1)
+            return self.all & ~bitmap, pos
+        if token == '(':
+            bitmap, pos = self._parse_or(tokens, pos + 1)
+            if pos >= len(tokens) or tokens[pos] != ')':
+                raise ValueError("Missing ')' in tag expression.")
+            return bitmap, pos + 1
+        if token in ('&', '|', ')'):
+            raise ValueError(f"Unexpected '{token}' in tag expression.")
+        return self.bitmaps.get(normalize_tag(token), 0), pos + 1
+
+    def url_hashes(self, bitmap:int):
+        """Returns the url hashes of the entries in `bitmap`, in ordinal order."""
+        return [self.ordinals[ordinal] for ordinal in _iter_ordinals(bitmap)]
+
+
+def _tokenize(expression:str):
+    tokens = []
+    pos = 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        match = _TOKEN.match(expression, pos)
+        if match is None:
+            raise ValueError(f"Invalid tag expression '{expression}'.")
+        token = match.group(1)
+        tokens.append(_OPERATOR_WORDS.get(token.lower(), token))
+        pos = match.end()
+    if not tokens:
+        raise ValueError("Empty tag expression.")
+    return tokens
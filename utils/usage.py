@@ -0,0 +1,84 @@
+# Usage-frequency tracking for WebPassAccess
+# Author: Indrajit Ghosh
+# Created On: Oct 19, 2026
+#
+# Keeps a small access counter, last-used timestamp and exponentially decayed
+# frequency score per website (by url hash). The stats live in their own file
+# so recording a visit never rewrites `websites_data.json`.
+#
+
+# Standard library imports
+import json
+import math
+import time
+from pathlib import Path
+
+# Local imports
+from utils.common import atomic_write
+
+HALF_LIFE_DAYS = 30
+
+
+class UsageStats:
+    """
+    Decayed access frequency per url hash.
+
+    The score of an entry halves every `half_life_days` and every visit adds 1,
+    so recently and frequently visited sites score highest.
+
+    Args:
+        filepath (Path): The stats file. It is created on the first `save()`.
+        half_life_days (float, optional): Defaults to HALF_LIFE_DAYS.
+    """
+    def __init__(self, filepath, half_life_days:float=HALF_LIFE_DAYS):
+        self.filepath = Path(filepath)
+        self._decay = math.log(2) / (half_life_days * 24 * 3600)
+        if self.filepath.exists():
+            with open(self.filepath, 'r') as f:
+                self._stats = json.load(f)
+        else:
+            self._stats = {}
+
+    def __contains__(self, url_hash):
+        return url_hash in self._stats
+
+    def _decayed(self, stats:dict, now:float):
+        return stats['score'] * math.exp(-self._decay * max(0.0, now - stats['last_used']))
+
+    def record(self, url_hash:str, now:float=None):
+        """Records one access of `url_hash`."""
+        now = now or time.time()
+        stats = self._stats.get(url_hash)
+        if stats is None:
+            self._stats[url_hash] = {'count': 1, 'score': 1.0, 'last_used': now}
+        else:
+            stats['score'] = self._decayed(stats, now) + 1.0
+            stats['count'] += 1
+            stats['last_used'] = now
+
+    def forget(self, url_hash:str):
+        self._stats.pop(url_hash, None)
+
+    def score(self, url_hash:str, now:float=None):
+        stats = self._stats.get(url_hash)
+        if stats is None:
+            return 0.0
+        return self._decayed(stats, now or time.time())
+
+    def get(self, url_hash:str):
+        """Returns the raw `count`, `score` and `last_used` of `url_hash`, or None."""
+        return self._stats.get(url_hash)
+
+    def rank(self, url_hashes):
+        """Returns `url_hashes` sorted by decayed score, most used first."""
+        now = time.time()
+        return sorted(url_hashes, key=lambda url_hash: -self.score(url_hash, now))
+
+    def hottest(self, n:int=None):
+        """Returns the `n` most used url hashes (all of them if `n` is None)."""
+        ranked = self.rank(self._stats.keys())
+        return ranked if n is None else ranked[:n]
+
+    def save(self):
+        with atomic_write(self.filepath) as f:
+            json.dump(self._stats, f)